@@ -0,0 +1,16 @@
+import sqlite3
+
+# The admin's own database: users, sites and indexes derived from the site repositories.
+DB_PATH = 'zolanew_admin.db'
+
+
+def connect() -> sqlite3.Connection:
+    """Opens a connection to the admin database whose rows can be read by column name.
+
+    Returns:
+        sqlite3.Connection: A connection object to the SQLite database.
+
+    """
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Callable, Dict, Optional
+
+
+class AdmissionControl:
+    """Limits how many repository writes run at once and how many may wait.
+
+    Up to `max_active` requests run; up to `max_waiting` more wait at most
+    `max_wait` seconds for a slot. Anything beyond that is rejected at once,
+    so a slow remote turns into fast 503s instead of a pile of requests
+    that time out. Limits apply per worker process.
+    """
+
+    def __init__(self, max_active: int = 4, max_waiting: int = 16, max_wait: float = 5.0):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._waiting = 0
+        # Moving average of how long an admitted write takes, for Retry-After
+        self._service_time = 1.0
+        self.counters: Dict[str, int] = {
+            "admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_wait_timeout": 0,
+        }
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    def retry_after(self) -> int:
+        """Estimates in seconds when a rejected request is likely to get a slot."""
+        return max(1, math.ceil(self._service_time * (self._waiting + 1) / self.max_active))
+
+    async def acquire(self) -> bool:
+        """Waits for a slot; returns False if the request should be rejected."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_active)
+        if self._semaphore.locked():
+            if self._waiting >= self.max_waiting:
+                self.counters["rejected_queue_full"] += 1
+                return False
+            self.counters["queued"] += 1
+            self._waiting += 1
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.counters["rejected_wait_timeout"] += 1
+                return False
+            finally:
+                self._waiting -= 1
+                waited = time.monotonic() - start
+                self._total_wait += waited
+                self._max_wait_seen = max(self._max_wait_seen, waited)
+        else:
+            await self._semaphore.acquire()
+        self._active += 1
+        self.counters["admitted"] += 1
+        return True
+
+    def release(self, duration: float):
+        self._active -= 1
+        self._service_time = 0.8 * self._service_time + 0.2 * duration
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the counters plus current load and wait times."""
+        queued = self.counters["queued"]
+        return {
+            **self.counters,
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_active": self.max_active,
+            "max_waiting": self.max_waiting,
+            "avg_wait_seconds": round(self._total_wait / queued, 3) if queued else 0.0,
+            "max_wait_seconds": round(self._max_wait_seen, 3),
+            "avg_service_seconds": round(self._service_time, 3),
+        }
+
+
+class AdmissionMiddleware:
+    """Runs requests that write to a repository through an AdmissionControl.
+
+    `is_write(method, path)` picks the requests to limit; everything else,
+    including all read-only pages, passes straight through.
+    """
+
+    def __init__(self, app, control: AdmissionControl, is_write: Callable[[str, str], bool]):
+        self.app = app
+        self.control = control
+        self.is_write = is_write
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.is_write(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.control.acquire():
+            retry_after = self.control.retry_after()
+            logging.warning(f"Rejected {scope['method']} {scope['path']}: too many writes in progress, "
+                            f"retry in {retry_after}s")
+            body = json.dumps({"detail": "The server is busy saving other changes. Please try again shortly."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.release(time.monotonic() - start)
@@ -1,22 +1,43 @@
+import asyncio
 import logging
 import os
 import sqlite3
-from datetime import datetime  # <-- Add this import
-from typing import Any, Dict, Optional, Tuple
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import quote
 
 import toml
 from dotenv import load_dotenv
 from fastapi import FastAPI, Form, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from git import Repo
+from git import Actor, Repo
 from passlib.hash import pbkdf2_sha256
+from starlette.datastructures import UploadFile
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.responses import RedirectResponse
 
+import admin_db
+import admission
+import audit_log
+import autosave
+import concurrency
+import coordination
+import durable_io
+import fs_watcher
+import git_objects
+import history_index
+import image_uploads
+import link_graph
+import post_stats
+import scheduler
+import sites
+import sparse_checkout
+
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 logging.basicConfig(level=logging.INFO)
@@ -30,14 +51,45 @@ load_dotenv()
 # Initialize FastAPI app
 app = FastAPI()
 
+# Routes that commit to a site repository; the template delete route is a GET
+REPO_WRITE_ROUTES = ("/markdown/edit/", "/delete-post/", "/templates/new/", "/templates/edit/",
+                     "/add-new-post/", "/history-restore/", "/merge-resolve/")
+
+def is_repo_write(method: str, path: str) -> bool:
+    return path.startswith("/templates/delete/") or (method == "POST" and path.startswith(REPO_WRITE_ROUTES))
+
+# Bound concurrent repository writes per worker so a slow remote sheds load with
+# 503s instead of queueing requests until they time out; reads are not limited
+write_admission = admission.AdmissionControl(
+    max_active=int(os.getenv("WRITE_CONCURRENCY", 4)),
+    max_waiting=int(os.getenv("WRITE_QUEUE", 16)),
+    max_wait=float(os.getenv("WRITE_QUEUE_TIMEOUT", 5)),
+)
+app.add_middleware(admission.AdmissionMiddleware, control=write_admission, is_write=is_repo_write)
+
+# Record who changed what; added before the session middleware so it runs inside it
+audit_events = audit_log.AuditLog(lambda: get_db_connection())
+app.add_middleware(audit_log.AuditMiddleware, log=audit_events)
+
 # Configure session middleware
 secret_key = os.getenv("SECRET_KEY", "default_secret_key")
 app.add_middleware(SessionMiddleware, secret_key=secret_key)
 
-# Configure your Git repository (local path)
+# URLs under /site/<slug>/ act on that site
+app.add_middleware(sites.SitePrefixMiddleware)
+
+# Configure your Git repository (local path). More sites can be registered
+# from the Sites page; this one is always available as the "default" site.
 GIT_REPO_PATH = os.getenv("GIT_REPO_PATH")
-TEMPLATE_DIR = os.path.join(GIT_REPO_PATH, "templates")
-BLOG_CONTENT_PATH = os.path.join(GIT_REPO_PATH, "content", "blog")
+
+# Seconds a save or a delete may spend talking to the remote before answering 504
+GIT_TIMEOUTS = {
+    "save": float(os.getenv("GIT_SAVE_TIMEOUT", 20)),
+    "delete": float(os.getenv("GIT_DELETE_TIMEOUT", 45)),
+}
+
+# Commits are authored by the logged-in user as <username>@<GIT_AUTHOR_EMAIL_DOMAIN>
+GIT_AUTHOR_EMAIL_DOMAIN = os.getenv("GIT_AUTHOR_EMAIL_DOMAIN", "zola-admin.local")
 
 
 
@@ -56,6 +108,54 @@ templates = Jinja2Templates(directory="templates")
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.on_event("startup")
+async def refuse_insecure_defaults():
+    """Stops the server from starting with settings that are unsafe to deploy.
+
+    Set ALLOW_INSECURE_DEFAULTS=1 to only log the problems, e.g. for local development.
+    """
+    problems = []
+    # Every worker must sign sessions with the same, secret key
+    if secret_key == "default_secret_key" or len(secret_key) < 32:
+        problems.append("SECRET_KEY is unset or shorter than 32 characters (generate one with gen-env-key.py)")
+
+    with get_db_connection() as conn:
+        admin = conn.execute("SELECT password FROM users WHERE username = 'admin'").fetchone()
+    try:
+        if admin and verify_password("admin", admin["password"]):
+            problems.append("the admin user still has the default password")
+    except ValueError:
+        logging.warning("The admin password hash is not a pbkdf2_sha256 hash.")
+
+    if not problems:
+        return
+    if os.getenv("ALLOW_INSECURE_DEFAULTS", "").lower() in ("1", "true", "yes"):
+        for problem in problems:
+            logging.warning(f"Insecure setting: {problem}")
+        return
+    raise RuntimeError(f"Refusing to start: {'; '.join(problems)}. Set ALLOW_INSECURE_DEFAULTS=1 to override.")
+
+@app.on_event("startup")
+async def enable_shared_database():
+    # WAL lets worker processes read the database while another one writes
+    with get_db_connection() as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Checked on every request, so created here rather than on each check
+        coordination.CacheSignals.ensure_schema(conn)
+        conn.commit()
+
+@app.on_event("startup")
+async def fail_stale_image_renders():
+    # Renders left pending by a previous run will never finish
+    await run_in_threadpool(image_uploads.fail_stale_renders, get_db_connection)
+
+@app.on_event("startup")
+async def maintain_sparse_checkout():
+    # Keep the checkouts limited to content/ and templates/ when asked to
+    if sparse_checkout.sparse_checkout_enabled():
+        for site in site_registry.list():
+            sparse_checkout.ensure_sparse_checkout(Repo(site["repo_path"]))
+
 # Database connection
 def get_db_connection() -> sqlite3.Connection:
     """Establish a connection to the SQLite database.
@@ -64,12 +164,134 @@ def get_db_connection() -> sqlite3.Connection:
         sqlite3.Connection: A connection object to the SQLite database.
 
     """
-    conn = sqlite3.connect('zolanew_admin.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-    conn = sqlite3.connect('zolanew_admin.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return admin_db.connect()
+
+# Lets worker processes tell each other to drop cached state
+cache_signals = coordination.CacheSignals(get_db_connection)
+
+site_registry = sites.SiteRegistry(get_db_connection, GIT_REPO_PATH, cache_signals)
+
+def get_current_site(request: Request) -> sites.Site:
+    """Returns the site a request acts on.
+
+    The site comes from a /site/<slug>/ URL prefix, which is remembered in the
+    session, or else from the session, or else the default site.
+
+    Raises:
+        HTTPException: If the site is not registered.
+
+    """
+    prefixed_slug = request.scope.get("site_slug")
+    slug = prefixed_slug or request.session.get("site") or site_registry.default_slug()
+    site = site_registry.get(slug) if slug else None
+    if site is None:
+        raise HTTPException(status_code=404, detail="Site not found")
+    if prefixed_slug:
+        request.session["site"] = slug
+    return site
+
+def get_editor_site(request: Request, site_slug: Optional[str]) -> sites.Site:
+    """Returns the site an editor page was opened for.
+
+    Editors send the slug of their site along as `site_slug`, so choosing
+    another site in a second tab does not send their saves to the wrong
+    repository. Requests without it act on the current site.
+
+    Raises:
+        HTTPException: If the site is not registered.
+
+    """
+    if not site_slug:
+        return get_current_site(request)
+    site = site_registry.get(site_slug)
+    if site is None:
+        raise HTTPException(status_code=404, detail="Site not found")
+    return site
+
+# Watches content/ and templates/ for changes made outside the admin
+fs_events = fs_watcher.Watcher()
+live_updates = fs_watcher.EventHub()
+
+# Every worker watches the same files; only the leader of a site rewrites its indexes
+index_leaders: Dict[str, coordination.LeaderLock] = {}
+
+def refresh_derived_indexes(batch: fs_watcher.ChangeBatch):
+    """Brings indexes derived from site files up to date after a change on disk."""
+    site = site_registry.get(batch.site)
+    if site is None:
+        return
+    leader = index_leaders.setdefault(site.slug, coordination.leader_lock(site.repo_path, "derived-indexes"))
+    if not leader.is_leader():
+        return
+    with get_db_connection() as conn:
+        link_graph.apply_changes(conn, site.slug, site.repo_path, batch.paths)
+
+@app.on_event("startup")
+async def start_fs_watcher():
+    if not fs_watcher.watcher_enabled():
+        logging.info("Filesystem watcher disabled; pages will not update live.")
+        return
+    live_updates.bind(asyncio.get_running_loop())
+    fs_events.subscribe(refresh_derived_indexes)
+    fs_events.subscribe(live_updates.publish)
+    for site in site_registry.list():
+        await run_in_threadpool(fs_events.add_site, site["slug"], site["repo_path"])
+    fs_events.start()
+
+@app.on_event("shutdown")
+def flush_audit_log():
+    audit_events.flush()
+
+# Seconds between checks for scheduled publishing; 0 turns the scheduler off
+SCHEDULER_INTERVAL = float(os.getenv("SCHEDULER_INTERVAL", 30))
+
+def apply_scheduled_changes():
+    """Applies the due scheduled changes of every site.
+
+    This blocks on disk and git; call it through `run_in_threadpool`.
+    """
+    with get_db_connection() as conn:
+        slugs = scheduler.due_sites(conn)
+    for slug in slugs:
+        site = site_registry.get(slug)
+        if site is None:
+            logging.warning(f"Skipping scheduled changes of unknown site {slug}.")
+            continue
+        for result in scheduler.apply_due(site, get_db_connection, push_timeout=GIT_TIMEOUTS["save"]):
+            audit_events.record(
+                action=f"scheduled-{result['action']}", actor="scheduler", site=slug, target=result["path"],
+                before_blob=result.get("before_blob"), after_blob=result.get("after_blob"),
+                status=200 if result["status"] == "applied" else 500,
+            )
+
+async def run_scheduler():
+    while True:
+        delay = SCHEDULER_INTERVAL
+        try:
+            await run_in_threadpool(apply_scheduled_changes)
+            with get_db_connection() as conn:
+                next_due = scheduler.next_due(conn)
+            if next_due is not None and next_due > datetime.now(timezone.utc):
+                # Wake up for the next change instead of up to a whole interval later
+                delay = min(delay, max(1.0, (next_due - datetime.now(timezone.utc)).total_seconds()))
+        except Exception as e:
+            logging.error(f"Applying scheduled changes failed: {str(e)}")
+        await asyncio.sleep(delay)
+
+@app.on_event("startup")
+async def start_scheduler():
+    if SCHEDULER_INTERVAL <= 0:
+        logging.info("Scheduled publishing disabled.")
+        return
+    # Changes that came due while the admin was down are applied on the first tick
+    app.state.scheduler_task = asyncio.get_running_loop().create_task(run_scheduler())
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    task = getattr(app.state, "scheduler_task", None)
+    if task is not None:
+        # A tick cut short is picked up again on the next start
+        task.cancel()
 
 # Helper function to get the logged-in user
 def get_logged_in_user(request: Request):
@@ -107,18 +329,14 @@ def parse_front_matter(content: str) -> Tuple[Dict[str, Any], str]:
     if not content:
         return {}, ""
 
-    parts = content.split('+++', 2)
-    if len(parts) < 3:
-        return {}, content.strip()
-
-    front_matter_raw = parts[1].strip()
-    post_content = parts[2].strip()
-
     try:
-        front_matter = toml.loads(front_matter_raw)
+        front_matter, post_content = post_stats.load_front_matter(content)
     except toml.TomlDecodeError as e:
         print(f"Error parsing TOML: {e}")
-        front_matter = {}
+        front_matter, post_content = {}, post_stats.split_post(content)[1]
+    if front_matter is None:
+        return {}, content.strip()
+    post_content = post_content.strip()
 
     # Parse JSON-LD if it exists in the front matter
     if 'json_ld' in front_matter:
@@ -191,6 +409,190 @@ def parse_block(block: str) -> Dict[str, Any]:
         result[current_key] = parse_value(' '.join(current_value))
     return result
 
+def resolve_repo_path(path: str) -> str:
+    """Resolves a repository-relative path the admin is allowed to manage.
+
+    Args:
+        path (str): A path relative to the site repository, e.g. "content/blog/post.md".
+
+    Returns:
+        str: The normalised repository-relative path.
+
+    Raises:
+        HTTPException: If the path escapes the repository or lies outside the managed directories.
+
+    """
+    normalised = os.path.normpath(path).replace(os.sep, "/")
+    if normalised.startswith("../") or os.path.isabs(normalised) or not normalised.startswith(tuple(f"{p}/" for p in history_index.HISTORY_PATHS)):
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    return normalised
+
+PUSH_TIMEOUT_DETAIL = "The change was saved, but pushing it timed out; it will be pushed with the next change."
+
+def commit_author(user) -> Optional[Actor]:
+    """Returns the git author for commits made by a logged-in user."""
+    if not user:
+        return None
+    return Actor(user["username"], f'{user["username"]}@{GIT_AUTHOR_EMAIL_DOMAIN}')
+
+def audit(request: Request, user, action: str, target: Optional[str] = None, **details) -> Dict[str, Any]:
+    """Describes the change a request makes for the audit log.
+
+    Returns the entry, so blob ids can be added once they are known. The
+    entry is written when the response has been sent, with its status and
+    duration.
+    """
+    entry = {
+        "action": action,
+        "target": target,
+        "actor_id": user["userid"] if user else None,
+        "actor": user["username"] if user else None,
+        "site": request.scope.get("site_slug") or request.session.get("site") or site_registry.default_slug(),
+        **details,
+    }
+    request.state.audit = entry
+    return entry
+
+def save_file_and_commit(site: sites.Site, file_path: str, content: str, base_blob: Optional[str], message: str,
+                         author: Optional[Actor] = None) -> Tuple[Optional[str], str]:
+    """Writes a file and commits it, unless it changed since the editor loaded it.
+
+    Saves to different files run in parallel; saves to the same file take
+    turns. Uploaded images the content refers to are committed along with it.
+    The file is replaced atomically and is on disk before it is committed, so
+    a crash never leaves a truncated file behind. This blocks on disk and
+    git; call it through `run_in_threadpool`.
+
+    Args:
+        site (sites.Site): The site the file belongs to.
+        file_path (str): The absolute path of the file inside the site repository.
+        content (str): The new file content.
+        base_blob (Optional[str]): The blob id the editor was opened with,
+            concurrency.NULL_BLOB if the file must not exist yet, or None to skip the check.
+        message (str): The commit message.
+        author (Optional[Actor]): The commit author, defaulting to the server's git identity.
+
+    Returns:
+        Tuple[Optional[str], str]: The blob ids of the file before (None if it was new) and after the save.
+
+    Raises:
+        concurrency.ConflictError: If the file on disk no longer matches `base_blob`.
+        HTTPException: If writing, committing or pushing fails.
+
+    """
+    rel_path = os.path.relpath(file_path, site.repo_path)
+    repo = site.repo()
+    changes: Dict[str, Any] = {rel_path: content.encode()}
+    # Collected before taking the lock, as this may wait for image variants
+    for asset_path, asset in image_uploads.referenced_assets(get_db_connection, content).items():
+        try:
+            repo.head.commit.tree[asset_path]
+        except KeyError:
+            changes[asset_path] = asset
+    with site.path_locks.hold(rel_path):
+        current_blob = concurrency.file_blob_id(file_path)
+        if base_blob is not None and (current_blob or concurrency.NULL_BLOB) != base_blob:
+            current_content = ""
+            if current_blob:
+                with open(file_path) as f:
+                    current_content = f.read()
+            raise concurrency.ConflictError(rel_path, current_content, current_blob)
+
+        try:
+            durable_io.write_file(file_path, changes[rel_path])
+        except OSError as e:
+            logging.error(f"Error writing to file: {file_path}, {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to write the file.")
+
+        try:
+            git_objects.commit_changes(repo, changes, message, author=author)
+        except Exception as e:
+            logging.error(f"Git operation failed: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to commit the changes to the repository.")
+
+    if rel_path.startswith("content/") and rel_path.endswith(".md"):
+        post_stats.record_post(get_db_connection, site.slug, rel_path, content)
+        with get_db_connection() as conn:
+            link_graph.update_post(conn, site.slug, rel_path, content)
+
+    try:
+        site.push(timeout=GIT_TIMEOUTS["save"])
+    except sites.GitTimeout as e:
+        logging.error(str(e))
+        raise HTTPException(status_code=504, detail=PUSH_TIMEOUT_DETAIL)
+    except Exception as e:
+        logging.error(f"Git push failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to push the changes to the repository.")
+    return current_blob, concurrency.blob_id(content.encode())
+
+def pull_site(site: sites.Site, timeout: float):
+    """Pulls the latest commits of a site from origin.
+
+    Pull merges through the shared index, so the index is first synced with
+    commits made without it, and no worker syncs or pulls while it runs.
+    This blocks on git; call it through `run_in_threadpool`.
+    """
+    with coordination.repo_lock(site.repo_path, "pull"):
+        git_objects.flush_index_sync(site.repo_path)
+        with git_objects.index_sync_lock(site.repo_path):
+            site.repo().git.pull('origin', 'master', kill_after_timeout=timeout)  # or 'main', depending on your branch
+
+def read_for_editor(file_path: str) -> Tuple[str, str]:
+    """Reads a file to edit and returns its text with the blob id of its bytes on disk.
+
+    The blob id is taken from the raw bytes, so it matches what
+    `save_file_and_commit` compares against whatever line endings the file has.
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return data.decode('utf-8'), concurrency.blob_id(data)
+
+def site_file_history(site: sites.Site, rel_path: str) -> List[sqlite3.Row]:
+    """Returns the revisions of `rel_path`, indexing commits made since the last call.
+
+    The first call walks the whole history; call it through `run_in_threadpool`.
+    """
+    with get_db_connection() as conn:
+        history_index.update_index(conn, site.repo(), site.slug)
+        return history_index.file_history(conn, site.slug, rel_path)
+
+def site_backlinks(site: sites.Site, rel_path: str) -> List[str]:
+    """Returns the posts linking to `rel_path`, building the site's link graph on first use.
+
+    This may scan the content directory; call it through `run_in_threadpool`.
+    """
+    with get_db_connection() as conn:
+        link_graph.ensure_built(conn, site.slug, site.repo_path)
+        return link_graph.backlinks(conn, site.slug, rel_path)
+
+def autosave_context(user, site: sites.Site, post: str) -> Dict[str, Any]:
+    """Returns what an editor template needs to autosave `post` and offer its saved draft."""
+    with get_db_connection() as conn:
+        return {
+            "autosave_key": post,
+            "autosave": autosave.load(conn, user["userid"], site.slug, post),
+            "autosave_versions": autosave.versions(conn, user["userid"], site.slug, post),
+        }
+
+def discard_autosaves(user, site: sites.Site, *posts: str):
+    """Drops the autosaved drafts of posts that were just saved for real."""
+    with get_db_connection() as conn:
+        for post in posts:
+            autosave.discard(conn, user["userid"], site.slug, post)
+
+def conflict_response(request: Request, user, site: sites.Site, conflict: concurrency.ConflictError, base_blob: Optional[str], content: str):
+    """Renders the three-way merge view for a save that lost a race."""
+    merged, conflicts = concurrency.three_way_merge(site.repo(), base_blob, content, conflict.current_content)
+    return templates.TemplateResponse("merge.html", {
+        "request": request,
+        "user": user,
+        "path": conflict.path.replace(os.sep, "/"),
+        "merged": merged,
+        "conflicts": conflicts,
+        "current_blob": conflict.current_blob or concurrency.NULL_BLOB,
+        "site_slug": site.slug,
+    }, status_code=409)
+
 # Define the custom filter for URL encoding
 def url_encode(s):
     return quote(s)
@@ -218,11 +620,13 @@ async def login(request: Request):
 
 @app.post("/login/")
 async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    audit(request, None, "login", f"user:{username}")
     with get_db_connection() as conn:
         user = conn.execute('SELECT userid, username, password FROM users WHERE username = ?', (username,)).fetchone()
 
     if user and verify_password(password, user["password"]):  # Use your verify function
         request.session["user_id"] = user["userid"]  # Store user ID in session
+        request.state.audit.update(actor_id=user["userid"], actor=user["username"])
         return RedirectResponse(url="/dashboard/", status_code=303)
 
     raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -257,6 +661,7 @@ async def add_user(request: Request, username: str = Form(...), password: str =
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
+    audit(request, user, "add-user", f"user:{username}")
     hashed_password = hash_password(password)
 
     with get_db_connection() as conn:
@@ -285,6 +690,7 @@ async def modify_user_post(request: Request, userid: int, username: str = Form(.
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
+    audit(request, user, "modify-user", f"user:{userid}")
     hashed_password = hash_password(password)  # Use your hash function
 
     with get_db_connection() as conn:
@@ -298,14 +704,80 @@ async def delete_user(request: Request, userid: int):
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
+    audit(request, user, "delete-user", f"user:{userid}")
     with get_db_connection() as conn:
         conn.execute('DELETE FROM users WHERE userid = ?', (userid,))
         conn.commit()
     return RedirectResponse(url="/users/", status_code=303)
 
+# Site management routes
+
+@app.get("/sites/", response_class=HTMLResponse)
+async def get_sites(request: Request):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    sites_list = site_registry.list()
+    current_site = request.session.get("site") or site_registry.default_slug()
+    return templates.TemplateResponse("sites.html", {
+        "request": request,
+        "user": user,
+        "sites": sites_list,
+        "current_site": current_site,
+    })
+
+@app.get("/add-site/", response_class=HTMLResponse)
+async def add_site_form(request: Request):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+    return templates.TemplateResponse("add_site.html", {"request": request, "user": user})
+
+@app.post("/add-site/")
+async def add_site(request: Request, slug: str = Form(...), name: str = Form(...), repo_path: str = Form(...)):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    audit(request, user, "add-site", f"site:{slug.strip().lower()}")
+    try:
+        site_registry.add(slug.strip().lower(), name.strip(), repo_path.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Site already exists.")
+    if fs_watcher.watcher_enabled():
+        await run_in_threadpool(fs_events.add_site, slug.strip().lower(), repo_path.strip())
+        fs_events.start()
+    return RedirectResponse(url="/sites/", status_code=303)
+
+@app.get("/select-site/{slug}/")
+async def select_site(request: Request, slug: str):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    if site_registry.get(slug) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Site not found")
+    request.session["site"] = slug
+    return RedirectResponse(url="/list-posts/", status_code=303)
+
+@app.get("/delete-site/{slug}/")
+async def delete_site(request: Request, slug: str):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    audit(request, user, "delete-site", f"site:{slug}")
+    site_registry.remove(slug)
+    if request.session.get("site") == slug:
+        request.session.pop("site", None)
+    return RedirectResponse(url="/sites/", status_code=303)
+
 # Template management routes
-def list_html_templates():
-    template_dir = TEMPLATE_DIR
+def list_html_templates(site: sites.Site):
+    template_dir = site.template_dir
     try:
         templates = [f for f in os.listdir(template_dir) if f.endswith('.html')]
     except FileNotFoundError:
@@ -316,8 +788,8 @@ def list_html_templates():
         return []
     return templates
 
-def list_markdown_files(page: int = 1, limit: int = 20, section: str = None):
-    markdown_dir = BLOG_CONTENT_PATH
+def list_markdown_files(site: sites.Site, page: int = 1, limit: int = 20, section: str = None):
+    markdown_dir = site.blog_content_path
     markdown_files = []
 
     try:
@@ -364,7 +836,8 @@ async def get_markdown_files(request: Request, page: int = 1, section: str = Non
         return RedirectResponse(url="/login/", status_code=303)
 
     # Get the list of Markdown files and the total number of files
-    markdown_files_list, total_files = list_markdown_files(page=page, limit=20, section=section)
+    site = get_current_site(request)
+    markdown_files_list, total_files = list_markdown_files(site, page=page, limit=20, section=section)
 
     # Calculate the total number of pages
     total_pages = (total_files + 19) // 20  # Round up for total pages
@@ -376,7 +849,8 @@ async def get_markdown_files(request: Request, page: int = 1, section: str = Non
         "user": user,
         "page": page,
         "total_pages": total_pages,
-        "section": section  # Pass the current section for filtering
+        "section": section,  # Pass the current section for filtering
+        "site": site,
     })
 
 @app.get("/markdown/edit/{category}/{subcategory}/{file_name}", response_class=HTMLResponse)
@@ -386,13 +860,13 @@ async def edit_markdown(request: Request, category: str, subcategory: str, file_
             return RedirectResponse(url="/login/", status_code=303)
 
         # Construct the full path to the markdown file
-        markdown_path = os.path.join(BLOG_CONTENT_PATH, category, subcategory, file_name) if subcategory else os.path.join(BLOG_CONTENT_PATH, category, file_name)
+        site = get_current_site(request)
+        markdown_path = os.path.join(site.blog_content_path, category, subcategory, file_name) if subcategory else os.path.join(site.blog_content_path, category, file_name)
 
         if not os.path.exists(markdown_path):
             raise HTTPException(status_code=404, detail="Markdown file not found")
 
-        with open(markdown_path) as f:
-            markdown_content = f.read()
+        markdown_content, base_blob = read_for_editor(markdown_path)
 
         # Assume you have a function to extract front matter from the markdown content
         front_matter, content = parse_front_matter(markdown_content)
@@ -400,11 +874,16 @@ async def edit_markdown(request: Request, category: str, subcategory: str, file_
         return templates.TemplateResponse("edit_markdown.html", {
             "request": request,
             "file_name": file_name,
+            "base_blob": base_blob,
             "markdown_content": content,
             "front_matter": front_matter,
+            "stats": post_stats.compute_stats(content),
+            "backlinks": await run_in_threadpool(site_backlinks, site, os.path.relpath(markdown_path, site.repo_path)),
             "user": user,
             "category": category,
             "subcategory": subcategory,
+            "site_slug": site.slug,
+            **autosave_context(user, site, os.path.relpath(markdown_path, site.repo_path)),
         })
 
 @app.post("/markdown/edit/{category}/{subcategory}/{file_name}")
@@ -420,17 +899,22 @@ async def edit_markdown_post(
         og_image: str = Form(...),
         keywords: str = Form(...),
         content: str = Form(...),
+        base_blob: Optional[str] = Form(None),
+        site_slug: Optional[str] = Form(None),
     ):
         user = get_logged_in_user(request)
         if not user:
             return RedirectResponse(url="/login/", status_code=303)
 
         # Construct the full path to the markdown file
-        markdown_path = os.path.join(BLOG_CONTENT_PATH, category, subcategory, file_name) if subcategory else os.path.join(BLOG_CONTENT_PATH, category, file_name)
+        site = get_editor_site(request, site_slug)
+        markdown_path = os.path.join(site.blog_content_path, category, subcategory, file_name) if subcategory else os.path.join(site.blog_content_path, category, file_name)
 
         if not os.path.exists(markdown_path):
             raise HTTPException(status_code=404, detail="Markdown file not found")
 
+        stats = post_stats.compute_stats(content)
+
         # Generate the updated front matter
         front_matter = f"""+++
     title = "{title}"
@@ -438,7 +922,7 @@ async def edit_markdown_post(
     date = "{date}"
     draft = {str(draft).lower()}
     updated = "{datetime.now().isoformat()}"
-    reading_time = "N/A"
+    reading_time = "{post_stats.format_reading_time(stats['reading_time'])}"
     social_image = "{og_image}"
     tags = [{', '.join([f'"{tag.strip()}"' for tag in keywords.split(',')])}]
     +++"""
@@ -446,24 +930,15 @@ async def edit_markdown_post(
         # Combine front matter with content to make sure it is compatible as per zola.
         template_content = front_matter + "\n" + content
 
-        # Write the updated content to the file
+        # Write, commit and push unless someone else saved the file meanwhile
+        entry = audit(request, user, "edit-post", os.path.relpath(markdown_path, site.repo_path))
         try:
-            with open(markdown_path, 'w') as f:
-                f.write(template_content)
-        except OSError as e:
-            logging.error(f"Error writing to file: {markdown_path}, {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to update the Markdown file.")
-
-        # Commit and push changes to Git
-        try:
-            repo = Repo(GIT_REPO_PATH)
-            repo.git.add(markdown_path)
-            repo.index.commit(f"Edit markdown file: {file_name}")
-            origin = repo.remote(name="origin")
-            origin.push()
-        except Exception as e:
-            logging.error(f"Git operation failed: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to commit and push the changes to the repository.")
+            entry["before_blob"], entry["after_blob"] = await run_in_threadpool(
+                save_file_and_commit, site, markdown_path, template_content, base_blob,
+                f"Edit markdown file: {file_name}", commit_author(user))
+        except concurrency.ConflictError as e:
+            return conflict_response(request, user, site, e, base_blob, template_content)
+        discard_autosaves(user, site, os.path.relpath(markdown_path, site.repo_path))
 
         return RedirectResponse(url="/list-posts/", status_code=303)
 
@@ -476,9 +951,10 @@ async def delete_blog_post(request: Request, category: str, file_name: str, subc
         return RedirectResponse(url="/login/", status_code=303)
 
     # Construct the full path for deletion
+    site = get_current_site(request)
     subcategory_path = subcategory if subcategory else ''
     full_path = os.path.join(category, subcategory_path, file_name)
-    file_path = os.path.join(BLOG_CONTENT_PATH, full_path)
+    file_path = os.path.join(site.blog_content_path, full_path)
 
     logging.info(f"Constructed file path for deletion: {file_path}")
 
@@ -487,25 +963,37 @@ async def delete_blog_post(request: Request, category: str, file_name: str, subc
         raise HTTPException(status_code=404, detail="File not found")
 
     # Pull the latest changes from the remote repository
+    deadline = time.monotonic() + GIT_TIMEOUTS["delete"]
     try:
-        repo = Repo(GIT_REPO_PATH)
-        repo.git.pull('origin', 'master')  # or 'main', depending on your branch
+        repo = site.repo()
+        # Off the event loop, so pages keep loading while the remote is slow
+        await run_in_threadpool(pull_site, site, GIT_TIMEOUTS["delete"])
         logging.info("Successfully pulled the latest changes from the remote repository.")
     except Exception as e:
         logging.error(f"Git pull failed: {str(e)}")
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=504, detail="Pulling the latest changes timed out; nothing was deleted.")
         raise HTTPException(status_code=500, detail="Failed to pull the latest changes from the repository.")
 
+    rel_path = os.path.relpath(file_path, site.repo_path)
+    audit(request, user, "delete-post", rel_path, before_blob=concurrency.file_blob_id(file_path))
+
     # Attempt to delete the file
     try:
         os.remove(file_path)
         logging.info(f"File successfully deleted: {file_path}")
 
         # Commit and push the deletion to Git
-        repo.git.add(file_path)  # Stage the deletion
-        repo.index.commit(f"Delete file: {full_path}")  # Commit the deletion
-        repo.git.push('origin', 'master')  # Push changes to the remote
+        await run_in_threadpool(git_objects.commit_changes, repo, {rel_path: None}, f"Delete file: {full_path}",
+                                commit_author(user))
+        with get_db_connection() as conn:
+            link_graph.remove_post(conn, site.slug, rel_path)
+        await run_in_threadpool(site.push, max(deadline - time.monotonic(), 1.0))
         logging.info(f"Git operations successful for deleting: {full_path}")
 
+    except sites.GitTimeout as e:
+        logging.error(str(e))
+        raise HTTPException(status_code=504, detail=PUSH_TIMEOUT_DETAIL)
     except OSError as e:
         logging.error(f"Error deleting file: {file_path}, {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to delete the file.")
@@ -515,14 +1003,151 @@ async def delete_blog_post(request: Request, category: str, file_name: str, subc
 
     return RedirectResponse(url="/list-posts/", status_code=303)
 
+@app.get("/admission-stats/")
+async def admission_stats(request: Request):
+    """Reports queued and rejected repository writes of this worker process."""
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    return JSONResponse({"pid": os.getpid(), **write_admission.stats()})
+
+@app.get("/audit/", response_class=HTMLResponse)
+async def audit_page(request: Request, actor: Optional[str] = None, action: Optional[str] = None,
+                     target: Optional[str] = None, site: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, page: int = 1):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    limit = 100
+    # Entries still in the buffer should show up too
+    await run_in_threadpool(audit_events.flush)
+    filters = {"actor": actor, "action": action, "target": target, "site": site, "since": since, "until": until}
+    with get_db_connection() as conn:
+        entries = audit_log.query(conn, **filters, limit=limit + 1, offset=(page - 1) * limit)
+        choices = {column: audit_log.distinct_values(conn, column) for column in ("actor", "action", "site")}
+    return templates.TemplateResponse("audit.html", {
+        "request": request,
+        "user": user,
+        "entries": entries[:limit],
+        "filters": filters,
+        "choices": choices,
+        "page": page,
+        "has_next": len(entries) > limit,
+        "query": "&".join(f"{k}={quote(v)}" for k, v in filters.items() if v),
+    })
+
+@app.get("/schedule/", response_class=HTMLResponse)
+async def schedule_page(request: Request, path: Optional[str] = None):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    site = get_current_site(request)
+    with get_db_connection() as conn:
+        changes = scheduler.changes(conn, site.slug)
+    return templates.TemplateResponse("schedule.html", {
+        "request": request,
+        "user": user,
+        "site": site,
+        "changes": changes,
+        "path": path or "",
+        "interval": SCHEDULER_INTERVAL,
+    })
+
+@app.post("/schedule/")
+async def schedule_change(request: Request, path: str = Form(...), action: str = Form(...), due_at: str = Form(...),
+                          tz_offset: int = Form(0)):
+    """Schedules a post to be published or unpublished.
+
+    `due_at` is a local date and time as sent by a datetime-local input, and
+    `tz_offset` the browser's offset from UTC in minutes as reported by
+    `Date.getTimezoneOffset()`.
+    """
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    site = get_current_site(request)
+    rel_path = os.path.normpath(path.strip().lstrip("/")).replace(os.sep, "/")
+    if not rel_path.startswith("content/"):
+        rel_path = f"content/{rel_path}"
+    if ".." in rel_path.split("/") or not rel_path.endswith(".md"):
+        raise HTTPException(status_code=400, detail="Expected the path of a post, e.g. blog/technology/post.md")
+    if not os.path.isfile(os.path.join(site.repo_path, rel_path)):
+        raise HTTPException(status_code=404, detail=f"{rel_path} does not exist")
+    if action not in scheduler.ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown action: {action}")
+    try:
+        due = datetime.fromisoformat(due_at).replace(tzinfo=timezone.utc) + timedelta(minutes=tz_offset)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {due_at}")
+
+    audit(request, user, f"schedule-{action}", rel_path)
+    with get_db_connection() as conn:
+        scheduler.schedule(conn, site.slug, rel_path, action, due, user["username"])
+    return RedirectResponse(url="/schedule/", status_code=303)
+
+@app.post("/schedule/{change_id}/cancel/")
+async def cancel_scheduled_change(request: Request, change_id: int):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    audit(request, user, "cancel-schedule", f"schedule:{change_id}")
+    with get_db_connection() as conn:
+        if not scheduler.cancel(conn, get_current_site(request).slug, change_id):
+            raise HTTPException(status_code=409, detail="This change was already applied or cancelled.")
+    return RedirectResponse(url="/schedule/", status_code=303)
+
+@app.get("/backlinks/")
+async def get_backlinks(request: Request, path: str):
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+
+    rel_path = resolve_repo_path(path)
+    backlinks = await run_in_threadpool(site_backlinks, get_current_site(request), rel_path)
+    return JSONResponse({"path": rel_path, "backlinks": backlinks})
+
+@app.get("/events/")
+async def site_events(request: Request):
+    """Streams changes to the current site's files as server-sent events."""
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+
+    site = get_current_site(request)
+    return StreamingResponse(
+        live_updates.stream(site.slug, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/broken-links/", response_class=HTMLResponse)
+async def broken_links(request: Request):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    site = get_current_site(request)
+
+    def find_broken_links():
+        with get_db_connection() as conn:
+            link_graph.ensure_built(conn, site.slug, site.repo_path)
+            return link_graph.broken_links(conn, site.slug, site.repo_path)
+
+    links = await run_in_threadpool(find_broken_links)
+    return templates.TemplateResponse("broken_links.html", {"request": request, "user": user, "site": site, "links": links})
+
 @app.get("/templates/", response_class=HTMLResponse)
 async def templates_index(request: Request):
     user = get_logged_in_user(request)
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
-    templates_list = list_html_templates()
-    return templates.TemplateResponse("templates.html", {"request": request, "templates": templates_list, "user": user})
+    templates_list = list_html_templates(get_current_site(request))
+    return templates.TemplateResponse("template_list.html", {"request": request, "templates": templates_list, "user": user})
 
 @app.get("/templates/new/", response_class=HTMLResponse)
 async def new_template(request: Request):
@@ -530,33 +1155,30 @@ async def new_template(request: Request):
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
-    return templates.TemplateResponse("new_template.html", {"request": request, "user": user})
+    return templates.TemplateResponse("new_template.html", {
+        "request": request,
+        "user": user,
+        "site_slug": get_current_site(request).slug,
+    })
 
 @app.post("/templates/new/")
-async def new_template_post(request: Request, template_name: str = Form(...), content: str = Form(...)):
+async def new_template_post(request: Request, template_name: str = Form(...), content: str = Form(...),
+                            site_slug: Optional[str] = Form(None)):
     user = get_logged_in_user(request)
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
-    template_path = os.path.join(TEMPLATE_DIR, f"{template_name}.html")
+    site = get_editor_site(request, site_slug)
+    template_path = os.path.join(site.template_dir, f"{template_name}.html")
 
+    # The null base blob refuses to overwrite an existing template
+    entry = audit(request, user, "add-template", os.path.relpath(template_path, site.repo_path))
     try:
-        with open(template_path, 'w') as f:
-            f.write(content)
-    except OSError as e:
-        logging.error(f"Error writing to file: {template_path}, {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to create the template file.")
-
-    # Commit the new template to Git
-    try:
-        repo = Repo(GIT_REPO_PATH)
-        repo.git.add(template_path)
-        repo.index.commit(f"Add new template: {template_name}")
-        origin = repo.remote(name="origin")
-        origin.push()
-    except Exception as e:
-        logging.error(f"Git operation failed: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to commit and push the changes to the repository.")
+        entry["before_blob"], entry["after_blob"] = await run_in_threadpool(
+            save_file_and_commit, site, template_path, content, concurrency.NULL_BLOB,
+            f"Add new template: {template_name}", commit_author(user))
+    except concurrency.ConflictError as e:
+        return conflict_response(request, user, site, e, None, content)
 
     return RedirectResponse(url="/templates/", status_code=303)
 
@@ -566,46 +1188,41 @@ async def edit_template(request: Request, template_name: str):
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
-    template_path = os.path.join(TEMPLATE_DIR, f"{template_name}.html")
+    site = get_current_site(request)
+    template_path = os.path.join(site.template_dir, f"{template_name}.html")
     if not os.path.exists(template_path):
         raise HTTPException(status_code=404, detail="Template not found")
 
-    with open(template_path) as f:
-        template_content = f.read()
+    template_content, base_blob = read_for_editor(template_path)
 
     return templates.TemplateResponse("edit_template.html", {
         "request": request,
         "template_name": template_name,
         "template_content": template_content,
+        "base_blob": base_blob,
+        "site_slug": site.slug,
         "user": user
     })
 
 @app.post("/templates/edit/{template_name}")
-async def edit_template_post(request: Request, template_name: str, content: str = Form(...)):
+async def edit_template_post(request: Request, template_name: str, content: str = Form(...),
+                             base_blob: Optional[str] = Form(None), site_slug: Optional[str] = Form(None)):
     user = get_logged_in_user(request)
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
-    template_path = os.path.join(TEMPLATE_DIR, f"{template_name}.html")
+    site = get_editor_site(request, site_slug)
+    template_path = os.path.join(site.template_dir, f"{template_name}.html")
     if not os.path.exists(template_path):
         raise HTTPException(status_code=404, detail="Template not found")
 
+    entry = audit(request, user, "edit-template", os.path.relpath(template_path, site.repo_path))
     try:
-        with open(template_path, 'w') as f:
-            f.write(content)
-    except OSError as e:
-        logging.error(f"Error writing to file: {template_path}, {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to update the template file.")
-
-    try:
-        repo = Repo(GIT_REPO_PATH)
-        repo.git.add(template_path)
-        repo.index.commit(f"Edit template: {template_name}")
-        origin = repo.remote(name="origin")
-        origin.push()
-    except Exception as e:
-        logging.error(f"Git operation failed: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to commit and push the changes to the repository.")
+        entry["before_blob"], entry["after_blob"] = await run_in_threadpool(
+            save_file_and_commit, site, template_path, content, base_blob,
+            f"Edit template: {template_name}", commit_author(user))
+    except concurrency.ConflictError as e:
+        return conflict_response(request, user, site, e, base_blob, content)
 
     return RedirectResponse(url="/templates/", status_code=303)
 
@@ -615,10 +1232,13 @@ async def delete_template(request: Request, template_name: str):
     if not user:
         return RedirectResponse(url="/login/", status_code=303)
 
-    template_path = os.path.join(TEMPLATE_DIR, f"{template_name}.html")
+    site = get_current_site(request)
+    template_path = os.path.join(site.template_dir, f"{template_name}.html")
     if not os.path.exists(template_path):
         raise HTTPException(status_code=404, detail="Template not found")
 
+    rel_path = os.path.relpath(template_path, site.repo_path)
+    audit(request, user, "delete-template", rel_path, before_blob=concurrency.file_blob_id(template_path))
     try:
         os.remove(template_path)
     except OSError as e:
@@ -626,11 +1246,13 @@ async def delete_template(request: Request, template_name: str):
         raise HTTPException(status_code=500, detail="Failed to delete the template file.")
 
     try:
-        repo = Repo(GIT_REPO_PATH)
-        repo.git.rm(template_path)
-        repo.index.commit(f"Delete template: {template_name}")
-        origin = repo.remote(name="origin")
-        origin.push()
+        repo = site.repo()
+        await run_in_threadpool(git_objects.commit_changes, repo, {rel_path: None}, f"Delete template: {template_name}",
+                                commit_author(user))
+        await run_in_threadpool(site.push, GIT_TIMEOUTS["delete"])
+    except sites.GitTimeout as e:
+        logging.error(str(e))
+        raise HTTPException(status_code=504, detail=PUSH_TIMEOUT_DETAIL)
     except Exception as e:
         logging.error(f"Git operation failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to commit and push the changes to the repository.")
@@ -644,6 +1266,7 @@ async def new_post(request: Request, category: Optional[str] = None, subcategory
         return RedirectResponse(url="/login/", status_code=303)
 
     is_edit = file_name is not None
+    site = get_current_site(request)
     template_data = {
         "template_name": "",
         "category": category or "",
@@ -664,19 +1287,20 @@ async def new_post(request: Request, category: Optional[str] = None, subcategory
         "content": "",
         "is_edit": is_edit,
         "original_file_name": file_name,
+        "base_blob": concurrency.NULL_BLOB,
+        "site_slug": site.slug,
     }
 
     if is_edit:
-        post_path = os.path.join(BLOG_CONTENT_PATH, category or '', subcategory or '', file_name or '')
+        post_path = os.path.join(site.blog_content_path, category or '', subcategory or '', file_name or '')
         if not os.path.exists(post_path):
             raise HTTPException(status_code=404, detail="File not found")
 
         try:
-            with open(post_path, encoding='utf-8') as f:
-                content = f.read()
+            content, base_blob = read_for_editor(post_path)
         except Exception as e:
             print(f"Error reading file: {e}")
-            content = ""
+            content, base_blob = "", concurrency.blob_id(b"")
 
         front_matter, post_content = parse_front_matter(content)
 
@@ -696,7 +1320,12 @@ async def new_post(request: Request, category: Optional[str] = None, subcategory
             "json_ld_description": front_matter.get("json_ld", {}).get("description", ""),
             "json_ld_url": front_matter.get("json_ld", {}).get("url", ""),
             "content": post_content,  # No need to escape here
+            "base_blob": base_blob,
+            "backlinks": await run_in_threadpool(site_backlinks, site, os.path.relpath(post_path, site.repo_path)),
+            **autosave_context(user, site, os.path.relpath(post_path, site.repo_path)),
         })
+    else:
+        template_data.update(autosave_context(user, site, autosave.NEW_POST))
 
     return templates.TemplateResponse("new_post.html", {**template_data, "request": request})
 
@@ -721,9 +1350,15 @@ async def add_new_post(
     json_ld_url: Optional[str] = Form(None),
     content: str = Form(...),
     is_edit: bool = Form(False),
-    original_file_name: Optional[str] = Form(None)
+    original_file_name: Optional[str] = Form(None),
+    base_blob: Optional[str] = Form(None),
+    site_slug: Optional[str] = Form(None)
 ):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
 
+    stats = post_stats.compute_stats(content)
 
     # Prepare front matter
     front_matter = f"""+++
@@ -733,7 +1368,7 @@ async def add_new_post(
     author = "[{author}]"
     draft = {str(draft).lower()}
     updated = "{datetime.now().isoformat()}"
-    reading_time = "N/A"
+    reading_time = "{post_stats.format_reading_time(stats['reading_time'])}"
     social_image = "{og_image or ''}"
     tags = [{', '.join([f'"{tag.strip()}"' for tag in keywords.split(',')])}]
     categories = ["{category}", "{subcategory}"]
@@ -762,25 +1397,116 @@ async def add_new_post(
     post_content = front_matter + "\n" + content  # Corrected variable name from front_mater to front_matter
 
     file_name = original_file_name if is_edit else f"{template_name.lower().replace(' ', '-')}.md"
-    file_path = os.path.join(BLOG_CONTENT_PATH, category, subcategory or '', file_name)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-    with open(file_path, 'w') as f:
-        f.write(post_content)
+    site = get_editor_site(request, site_slug)
+    file_path = os.path.join(site.blog_content_path, category, subcategory or '', file_name)
 
-    # Git operations
-    repo = Repo(GIT_REPO_PATH)
-    repo.git.add(file_path)
+    # Write, commit and push unless someone else saved the file meanwhile
     commit_message = f"Update post: {template_name}" if is_edit else f"Add new post: {template_name}"
-    repo.index.commit(commit_message)
-    origin = repo.remote(name='origin')
-    origin.push()
+    entry = audit(request, user, "edit-post" if is_edit else "add-post", os.path.relpath(file_path, site.repo_path))
+    try:
+        entry["before_blob"], entry["after_blob"] = await run_in_threadpool(
+            save_file_and_commit, site, file_path, post_content, base_blob, commit_message, commit_author(user))
+    except concurrency.ConflictError as e:
+        return conflict_response(request, user, site, e, base_blob, post_content)
+    discard_autosaves(user, site, os.path.relpath(file_path, site.repo_path), *([] if is_edit else [autosave.NEW_POST]))
 
     return RedirectResponse(
         url=f"/new-post-added/?template_name={quote(template_name)}&category={quote(category)}&subcategory={quote(subcategory or '')}",
         status_code=302
         )
 
+@app.post("/autosave/")
+async def autosave_draft(request: Request):
+    """Stores the state of an open editor without touching the repository.
+
+    Expects JSON with "post" (the repository path, or "new"), "session" (an
+    id picked by the editor page), "base_blob", "state" (the form fields)
+    and "site", the slug of the editor's site.
+    """
+    request.state.audit = False  # Drafts are not changes to the site
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Expected a JSON body")
+    post, session, state = payload.get("post"), payload.get("session"), payload.get("state")
+    if not (isinstance(post, str) and post and isinstance(session, str) and session and isinstance(state, dict)):
+        raise HTTPException(status_code=400, detail="post, session and state are required")
+    site = get_editor_site(request, payload.get("site") if isinstance(payload.get("site"), str) else None)
+
+    def store():
+        with get_db_connection() as conn:
+            return autosave.save(conn, user["userid"], site.slug, post[:1024], session[:64],
+                                 payload.get("base_blob"), state)
+    try:
+        return JSONResponse(await run_in_threadpool(store))
+    except autosave.StateTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except sqlite3.Error as e:
+        logging.error(f"Failed to autosave {post}: {str(e)}")
+        raise HTTPException(status_code=503, detail="Autosave is unavailable right now.")
+
+@app.get("/autosave/")
+async def get_autosave(request: Request, post: str, version: Optional[int] = None, site: Optional[str] = None):
+    """Returns an autosaved draft of a post, the newest version by default."""
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    with get_db_connection() as conn:
+        draft = autosave.load(conn, user["userid"], get_editor_site(request, site).slug, post, version)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="No autosaved draft")
+    return JSONResponse(draft)
+
+@app.delete("/autosave/")
+async def delete_autosave(request: Request, post: str, through: Optional[int] = None, site: Optional[str] = None):
+    """Discards the autosaved versions of a post, or those up to version `through`."""
+    request.state.audit = False
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    with get_db_connection() as conn:
+        deleted = autosave.discard(conn, user["userid"], get_editor_site(request, site).slug, post, through)
+    return JSONResponse({"deleted": deleted})
+
+@app.post("/upload-image/")
+async def upload_image(request: Request):
+    """Stores an uploaded image, sent as the "file" form field, and returns the URL to put in the post.
+
+    The image is committed to the site together with the first post that
+    refers to it; resized and WebP variants are rendered in the background.
+    The form is parsed here rather than declared as a parameter, so that
+    oversized uploads are refused before their body is spooled to disk.
+    """
+    user = get_logged_in_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not logged in")
+
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > image_uploads.UPLOAD_MAX_BYTES + image_uploads.MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {image_uploads.UPLOAD_MAX_BYTES // (1024 * 1024)} MiB")
+    form = await request.form(max_files=1, max_fields=10)
+    file = form.get("file")
+    if not isinstance(file, UploadFile):
+        raise HTTPException(status_code=400, detail="Expected an image in the file field")
+
+    entry = audit(request, user, "upload-image", file.filename)
+    try:
+        digest, extension, size, is_new = await run_in_threadpool(image_uploads.save_upload, file.file, file.filename or "")
+    except image_uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        logging.error(f"Error storing upload {file.filename}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to store the image.")
+    finally:
+        await file.close()
+
+    entry["target"] = image_uploads.asset_url(digest, extension)
+    await run_in_threadpool(image_uploads.register_upload, get_db_connection, digest, extension, file.filename, size, is_new)
+    return JSONResponse({"url": image_uploads.asset_url(digest, extension), "digest": digest, "size": size})
+
 @app.get("/new-post-added/", response_class=HTMLResponse)
 async def new_post_added(
     request: Request,
@@ -798,3 +1524,104 @@ async def new_post_added(
         "category": category,
         "subcategory": subcategory or "none",  # Handle if subcategory is None
     })
+
+# History routes
+
+@app.get("/history/{path:path}", response_class=HTMLResponse)
+async def file_history(request: Request, path: str):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    path = resolve_repo_path(path)
+    site = get_current_site(request)
+    try:
+        revisions = await run_in_threadpool(site_file_history, site, path)
+    except Exception as e:
+        logging.error(f"Failed to load history for {path}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to load the file history.")
+
+    return templates.TemplateResponse("history.html", {
+        "request": request,
+        "user": user,
+        "path": path,
+        "revisions": [
+            {**dict(r), "authored_at": datetime.fromtimestamp(r["authored_at"]).strftime("%Y-%m-%d %H:%M")}
+            for r in revisions
+        ],
+    })
+
+@app.get("/history-diff/", response_class=HTMLResponse)
+async def file_history_diff(request: Request, path: str, old: str, new: str):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    path = resolve_repo_path(path)
+    site = get_current_site(request)
+    with get_db_connection() as conn:
+        # The file may have lived at another path before a rename.
+        paths = history_index.revision_paths(conn, site.slug, path)
+    if old not in paths or new not in paths:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    try:
+        diff = await run_in_threadpool(history_index.diff_revisions, site.repo(), old, new, paths[old], paths[new])
+    except Exception as e:
+        logging.error(f"Failed to diff {path} between {old} and {new}: {str(e)}")
+        raise HTTPException(status_code=404, detail="Revision not found")
+
+    return templates.TemplateResponse("history_diff.html", {
+        "request": request,
+        "user": user,
+        "path": path,
+        "old": old,
+        "new": new,
+        "diff_lines": diff.splitlines(),
+    })
+
+@app.post("/history-restore/")
+async def restore_file_revision(request: Request, path: str = Form(...), sha: str = Form(...)):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    path = resolve_repo_path(path)
+    site = get_current_site(request)
+    with get_db_connection() as conn:
+        # Only revisions of this file; the index also knows its path before a rename
+        paths = history_index.revision_paths(conn, site.slug, path)
+    if sha not in paths:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    try:
+        content = await run_in_threadpool(history_index.file_at_revision, site.repo(), paths[sha], sha)
+    except Exception as e:
+        logging.error(f"Failed to read {path} at {sha}: {str(e)}")
+        raise HTTPException(status_code=404, detail="Revision not found")
+
+    file_path = os.path.join(site.repo_path, path)
+    entry = audit(request, user, "restore", path)
+    entry["before_blob"], entry["after_blob"] = await run_in_threadpool(
+        save_file_and_commit, site, file_path, content, None, f"Restore {path} to {sha[:7]}", commit_author(user))
+
+    return RedirectResponse(url=f"/history/{quote(path)}", status_code=303)
+
+@app.post("/merge-resolve/")
+async def merge_resolve(request: Request, path: str = Form(...), base_blob: str = Form(...), content: str = Form(...),
+                        site_slug: Optional[str] = Form(None)):
+    user = get_logged_in_user(request)
+    if not user:
+        return RedirectResponse(url="/login/", status_code=303)
+
+    path = resolve_repo_path(path)
+    site = get_editor_site(request, site_slug)
+    file_path = os.path.join(site.repo_path, path)
+    content = content.replace("\r\n", "\n")  # Browsers submit textareas with CRLF line endings
+    entry = audit(request, user, "merge", path)
+    try:
+        entry["before_blob"], entry["after_blob"] = await run_in_threadpool(
+            save_file_and_commit, site, file_path, content, base_blob,
+            f"Merge concurrent edits: {path}", commit_author(user))
+    except concurrency.ConflictError as e:
+        return conflict_response(request, user, site, e, base_blob, content)
+
+    return RedirectResponse(url=f"/history/{quote(path)}", status_code=303)
@@ -0,0 +1,192 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Requests with these methods are logged even if the route adds no details.
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+_COLUMNS = ("occurred_at", "actor_id", "actor", "site", "action", "target",
+            "before_blob", "after_blob", "status", "duration_ms")
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the audit log table if it does not exist yet."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            occurred_at TEXT NOT NULL,
+            actor_id INTEGER,
+            actor TEXT,
+            site TEXT,
+            action TEXT NOT NULL,
+            target TEXT,
+            before_blob TEXT,
+            after_blob TEXT,
+            status INTEGER,
+            duration_ms REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_audit_log_occurred_at ON audit_log (occurred_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_audit_log_actor ON audit_log (actor, occurred_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_audit_log_action ON audit_log (action, occurred_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_audit_log_target ON audit_log (target, occurred_at)')
+
+
+class AuditLog:
+    """Buffers audit entries in memory and writes them to SQLite in batches.
+
+    `record` only appends to a deque, so logging adds no database write to
+    the request. A background thread flushes the buffer every
+    `flush_interval` seconds, or sooner once `batch_size` entries are
+    waiting. If the database is unavailable, entries stay buffered (up to
+    `max_buffered`, dropping the oldest) and are retried on the next flush.
+    """
+
+    def __init__(self, connect, flush_interval: float = 1.0, batch_size: int = 500, max_buffered: int = 100_000):
+        self._connect = connect
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._buffer = deque(maxlen=max_buffered)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._dropping = False
+
+    def record(self, action: str, actor_id: Optional[int] = None, actor: Optional[str] = None,
+               site: Optional[str] = None, target: Optional[str] = None, before_blob: Optional[str] = None,
+               after_blob: Optional[str] = None, status: Optional[int] = None, duration_ms: Optional[float] = None):
+        """Queues one audit entry."""
+        if len(self._buffer) == self._buffer.maxlen and not self._dropping:
+            self._dropping = True
+            logging.warning("Audit log buffer is full; dropping the oldest entries until the database catches up.")
+        occurred_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self._buffer.append((occurred_at, actor_id, actor, site, action, target,
+                             before_blob, after_blob, status, duration_ms))
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes all buffered entries in one transaction and returns how many were written."""
+        with self._flush_lock:
+            entries = []
+            while self._buffer:
+                entries.append(self._buffer.popleft())
+            if not entries:
+                return 0
+            try:
+                with self._connect() as conn:
+                    ensure_schema(conn)
+                    conn.executemany(
+                        f'INSERT INTO audit_log ({", ".join(_COLUMNS)}) VALUES ({", ".join("?" * len(_COLUMNS))})',
+                        entries,
+                    )
+                    conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to write {len(entries)} audit entries, will retry: {str(e)}")
+                self._buffer.extendleft(reversed(entries))
+                return 0
+            self._dropping = False
+            return len(entries)
+
+
+class AuditMiddleware:
+    """Times each request and logs mutating ones to an AuditLog.
+
+    Routes describe what they did by setting `request.state.audit` to a dict
+    of AuditLog.record arguments (action, target, blob ids, actor). Requests
+    with a mutating method that set nothing are logged as "<METHOD> <path>";
+    routes that change nothing worth auditing set it to False.
+    Must run inside SessionMiddleware so the logged-in user is known.
+    """
+
+    def __init__(self, app, log: AuditLog):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Never return from here: that would swallow an exception raised by the app
+            entry: Optional[Dict[str, Any]] = state.get("audit")
+            if entry is None and scope["method"] in MUTATING_METHODS:
+                entry = {"action": f'{scope["method"]} {scope["path"]}'}
+            if entry is not None and entry is not False:
+                session = scope.get("session") or {}
+                entry.setdefault("actor_id", session.get("user_id"))
+                entry.setdefault("site", scope.get("site_slug") or session.get("site"))
+                self.log.record(status=status, duration_ms=round((time.perf_counter() - start) * 1000, 1), **entry)
+
+
+def query(conn: sqlite3.Connection, actor: Optional[str] = None, action: Optional[str] = None,
+          target: Optional[str] = None, site: Optional[str] = None, since: Optional[str] = None,
+          until: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[sqlite3.Row]:
+    """Returns audit entries matching all given filters, newest first.
+
+    `target` matches any part of the target; `since` and `until` are ISO
+    dates or timestamps compared against the UTC time of each entry.
+    """
+    ensure_schema(conn)
+    clauses, params = [], []
+    for column, value in (("actor", actor), ("action", action), ("site", site)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if target:
+        clauses.append("target LIKE ?")
+        params.append(f"%{target}%")
+    if since:
+        clauses.append("occurred_at >= ?")
+        params.append(since)
+    if until:
+        clauses.append("occurred_at < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return conn.execute(
+        f'SELECT * FROM audit_log {where} ORDER BY occurred_at DESC, id DESC LIMIT ? OFFSET ?',
+        (*params, limit, offset),
+    ).fetchall()
+
+
+def distinct_values(conn: sqlite3.Connection, column: str) -> List[str]:
+    """Returns the values seen in an audit column, for filter drop-downs."""
+    if column not in ("actor", "action", "site"):
+        raise ValueError(f"Cannot list values of {column}")
+    ensure_schema(conn)
+    return [row[0] for row in conn.execute(f'SELECT DISTINCT {column} FROM audit_log WHERE {column} IS NOT NULL ORDER BY 1')]
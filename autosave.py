@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Key of the draft of a post that has not been created yet
+NEW_POST = "new"
+# Versions kept per user and post; older ones are dropped.
+KEEP_VERSIONS = 5
+# Autosaves from one editor within this many seconds replace each other, so
+# the kept versions span a while instead of the last few keystrokes.
+VERSION_INTERVAL_SECONDS = 60
+# Upper bound for the uncompressed editor state.
+MAX_STATE_BYTES = 2 * 1024 * 1024
+
+
+class StateTooLarge(ValueError):
+    """Raised when an editor state exceeds MAX_STATE_BYTES."""
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the autosave table if it does not exist yet."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS autosaves (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            site TEXT NOT NULL,
+            post TEXT NOT NULL,
+            editor_session TEXT NOT NULL,
+            base_blob TEXT,
+            saved_at TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            state BLOB NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_autosaves_post ON autosaves (user_id, site, post, id)')
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def save(conn: sqlite3.Connection, user_id: int, site: str, post: str, editor_session: str,
+         base_blob: Optional[str], state: Dict[str, Any]) -> Dict[str, Any]:
+    """Stores the state of an editor, compressed.
+
+    The newest version is updated in place if the same editor session
+    saved it less than VERSION_INTERVAL_SECONDS ago; otherwise a new version
+    is added and all but the newest KEEP_VERSIONS are dropped. Another
+    session, e.g. the editor reopened later, therefore never overwrites the
+    draft it may still want to restore.
+
+    Args:
+        conn (sqlite3.Connection): The admin database.
+        user_id (int): The user editing.
+        site (str): The site slug.
+        post (str): The repository path of the post, or "new" for a post not created yet.
+        editor_session (str): An id the editor page picks when it is opened.
+        base_blob (Optional[str]): The blob id the editor was opened with.
+        state (Dict[str, Any]): The form fields of the editor.
+
+    Returns:
+        Dict[str, Any]: "id" and "saved_at" of the stored version.
+
+    Raises:
+        StateTooLarge: If the state is larger than MAX_STATE_BYTES.
+
+    """
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    if len(raw) > MAX_STATE_BYTES:
+        raise StateTooLarge(f"Editor state of {len(raw)} bytes exceeds {MAX_STATE_BYTES} bytes")
+    compressed = zlib.compress(raw, 6)
+    now = _now()
+    saved_at = now.isoformat(timespec="seconds")
+
+    ensure_schema(conn)
+    newest = conn.execute(
+        'SELECT id, editor_session, saved_at FROM autosaves WHERE user_id = ? AND site = ? AND post = ? '
+        'ORDER BY id DESC LIMIT 1',
+        (user_id, site, post),
+    ).fetchone()
+    if (newest is not None and newest[1] == editor_session
+            and (now - datetime.fromisoformat(newest[2])).total_seconds() < VERSION_INTERVAL_SECONDS):
+        # Keep the time the version was started, so it still closes after the interval
+        version_id, saved_at = newest[0], newest[2]
+        conn.execute('UPDATE autosaves SET base_blob = ?, size = ?, state = ? WHERE id = ?',
+                     (base_blob, len(raw), compressed, version_id))
+    else:
+        version_id = conn.execute(
+            'INSERT INTO autosaves (user_id, site, post, editor_session, base_blob, saved_at, size, state) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (user_id, site, post, editor_session, base_blob, saved_at, len(raw), compressed),
+        ).lastrowid
+        conn.execute(
+            'DELETE FROM autosaves WHERE user_id = ? AND site = ? AND post = ? AND id NOT IN '
+            '(SELECT id FROM autosaves WHERE user_id = ? AND site = ? AND post = ? ORDER BY id DESC LIMIT ?)',
+            (user_id, site, post, user_id, site, post, KEEP_VERSIONS),
+        )
+    conn.commit()
+    return {"id": version_id, "saved_at": saved_at}
+
+
+def versions(conn: sqlite3.Connection, user_id: int, site: str, post: str) -> List[Dict[str, Any]]:
+    """Returns the kept versions of a draft, newest first, without their state."""
+    ensure_schema(conn)
+    rows = conn.execute(
+        'SELECT id, editor_session, base_blob, saved_at, size FROM autosaves '
+        'WHERE user_id = ? AND site = ? AND post = ? ORDER BY id DESC',
+        (user_id, site, post),
+    ).fetchall()
+    return [{"id": r[0], "editor_session": r[1], "base_blob": r[2], "saved_at": r[3], "size": r[4]} for r in rows]
+
+
+def load(conn: sqlite3.Connection, user_id: int, site: str, post: str,
+         version_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Returns one version of a draft with its state, the newest one by default, or None."""
+    ensure_schema(conn)
+    query = ('SELECT id, editor_session, base_blob, saved_at, size, state FROM autosaves '
+             'WHERE user_id = ? AND site = ? AND post = ?')
+    params: List[Any] = [user_id, site, post]
+    if version_id is not None:
+        query += ' AND id = ?'
+        params.append(version_id)
+    row = conn.execute(query + ' ORDER BY id DESC LIMIT 1', params).fetchone()
+    if row is None:
+        return None
+    return {"id": row[0], "editor_session": row[1], "base_blob": row[2], "saved_at": row[3], "size": row[4],
+            "state": json.loads(zlib.decompress(row[5]))}
+
+
+def discard(conn: sqlite3.Connection, user_id: int, site: str, post: str, through: Optional[int] = None) -> int:
+    """Deletes the versions of a draft, or only those up to version `through`.
+
+    Returns:
+        int: The number of versions deleted.
+
+    """
+    ensure_schema(conn)
+    query = 'DELETE FROM autosaves WHERE user_id = ? AND site = ? AND post = ?'
+    params: List[Any] = [user_id, site, post]
+    if through is not None:
+        query += ' AND id <= ?'
+        params.append(through)
+    deleted = conn.execute(query, params).rowcount
+    conn.commit()
+    return deleted
@@ -0,0 +1,31 @@
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+import post_stats
+import sites
+from admin_db import connect
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Compute reading times, word counts and outlines for all posts.")
+    parser.add_argument("--site", help="Slug of the site to process (defaults to the GIT_REPO_PATH site)")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (defaults to the CPU count)")
+    parser.add_argument("--no-push", action="store_true", help="Commit without pushing")
+    args = parser.parse_args()
+
+    registry = sites.SiteRegistry(connect, os.getenv("GIT_REPO_PATH"))
+    slug = args.site or registry.default_slug()
+    site = registry.get(slug) if slug else None
+    if site is None:
+        parser.error(f"Unknown site: {slug}")
+
+    start = time.monotonic()
+    summary = post_stats.backfill(site, connect, workers=args.workers, push=not args.no_push)
+    site.close()
+    print(f"Scanned {summary['scanned']} posts in {time.monotonic() - start:.1f}s: "
+          f"{summary['updated']} updated, {summary['skipped']} unchanged since the last run, {summary['failed']} failed")
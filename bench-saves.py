@@ -0,0 +1,97 @@
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from git import Repo
+
+import durable_io
+import git_objects
+
+
+class ImmediateSync:
+    """Flushes every write on its own, for comparison with grouped flushing."""
+
+    def __init__(self):
+        self.flushes = 0
+
+    def sync(self, paths):
+        for path in paths:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.flushes += 1
+
+
+def plain_write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def run(mode: str, directory: str, writers: int, saves: int, size: int, commit: bool):
+    """Runs `saves` saves in each of `writers` threads; returns saves per second, latencies and flushes."""
+    repo = Repo.init(directory) if commit else None
+    syncer = {"fsync": ImmediateSync(), "grouped": durable_io.GroupSync()}.get(mode)
+    latencies = []
+    start_gate = threading.Barrier(writers + 1)
+
+    def writer(n):
+        data = os.urandom(size // 2).hex().encode()
+        start_gate.wait()
+        for i in range(saves):
+            rel_path = f"content/w{n}/post-{i % 20}.md"
+            path = os.path.join(directory, rel_path)
+            t = time.perf_counter()
+            if mode == "plain":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                plain_write(path, data)
+            else:
+                durable_io.write_file(path, data, durable=syncer is not None, syncer=syncer)
+            if commit:
+                git_objects.commit_changes(repo, {rel_path: data}, f"Save {rel_path}")
+            latencies.append(time.perf_counter() - t)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if repo is not None:
+        repo.close()
+    return writers * saves / elapsed, latencies, getattr(syncer, "flushes", 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure save throughput with and without durable writes.")
+    parser.add_argument("--dir", default=".", help="Where to create the scratch directory; use the disk the sites live on")
+    parser.add_argument("--writers", default="1,4,16,64", help="Comma-separated numbers of concurrent writers")
+    parser.add_argument("--saves", type=int, default=50, help="Saves per writer")
+    parser.add_argument("--size", type=int, default=8192, help="File size in bytes")
+    parser.add_argument("--modes", default="plain,atomic,fsync,grouped",
+                        help="plain: open/write; atomic: temp file and rename; "
+                             "fsync: atomic, flushed per write; grouped: atomic, flushed in groups")
+    parser.add_argument("--commit", action="store_true", help="Also commit every save, like the editor does")
+    args = parser.parse_args()
+
+    if durable_io.syncfs_available():
+        print("Grouped flushes use syncfs(2)")
+    print(f"{'mode':<8} {'writers':>7} {'saves/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'flushes':>8}")
+    for writers in (int(w) for w in args.writers.split(",")):
+        for mode in args.modes.split(","):
+            directory = tempfile.mkdtemp(prefix=".bench-saves-", dir=args.dir)
+            try:
+                rate, latencies, flushes = run(mode, directory, writers, args.saves, args.size, args.commit)
+            finally:
+                shutil.rmtree(directory)
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{mode:<8} {writers:>7} {rate:>9.0f} {statistics.median(latencies) * 1000:>8.2f} "
+                  f"{p99 * 1000:>8.2f} {flushes:>8}")
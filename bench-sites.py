@@ -0,0 +1,43 @@
+import argparse
+import os
+import tracemalloc
+
+from dotenv import load_dotenv
+
+import sites
+
+
+def measure_site_overhead(repo_path: str, samples: int = 20) -> int:
+    """Measures the Python memory, in bytes, taken by one more site.
+
+    Builds `samples` throwaway sites for `repo_path`, each with an open
+    repository handle, and returns the average allocation per site as
+    reported by tracemalloc. Push workers are not started; each adds one
+    idle thread once the site pushes for the first time.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        measured = [sites.Site(f"measure-{i}", "Measure", repo_path) for i in range(samples)]
+        handles = [site.repo() for site in measured]
+        after = tracemalloc.take_snapshot()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        del measured, handles
+    finally:
+        tracemalloc.stop()
+    return max(allocated, 0) // samples
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Measure the memory each additional site takes in a worker.")
+    parser.add_argument("--repo", default=os.getenv("GIT_REPO_PATH"), help="A site checkout (defaults to GIT_REPO_PATH)")
+    parser.add_argument("--samples", type=int, default=20, help="Number of throwaway sites to average over")
+    args = parser.parse_args()
+    if not args.repo:
+        parser.error("Pass --repo or set GIT_REPO_PATH")
+
+    overhead = measure_site_overhead(args.repo, args.samples)
+    print(f"Each additional site takes about {overhead / 1024:.1f} KiB of memory, "
+          f"plus one push worker thread once it pushes.")
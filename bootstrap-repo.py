@@ -0,0 +1,47 @@
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+from sparse_checkout import SPARSE_PATHS, clone_sparse
+
+
+def directory_size(path):
+    # Total size in bytes of all files below path
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            file_path = os.path.join(root, f)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+def bootstrap(remote_url, path, branch=None, partial=True):
+    if os.path.exists(path) and os.listdir(path):
+        raise SystemExit(f"{path} already exists and is not empty.")
+
+    start = time.monotonic()
+    repo = clone_sparse(remote_url, path, branch=branch, partial=partial)
+    elapsed = time.monotonic() - start
+
+    git_size = directory_size(repo.git_dir)
+    checkout_size = directory_size(path) - git_size
+    print(f"Cloned {remote_url} into {path} in {elapsed:.1f}s")
+    print(f"Checked out paths: {', '.join(SPARSE_PATHS)}")
+    print(f"Working tree: {checkout_size / 1024 / 1024:.1f} MiB, .git: {git_size / 1024 / 1024:.1f} MiB")
+    print("Set GIT_SPARSE_CHECKOUT=1 so the admin keeps the checkout sparse.")
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Create a sparse checkout of a Zola site for the admin.")
+    parser.add_argument("remote_url", help="URL of the site repository")
+    parser.add_argument("--path", default=os.getenv("GIT_REPO_PATH"), help="Checkout location (defaults to GIT_REPO_PATH)")
+    parser.add_argument("--branch", help="Branch to check out (defaults to the remote HEAD)")
+    parser.add_argument("--full", action="store_true", help="Download all file contents instead of a blob-filtered partial clone")
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.error("--path is required when GIT_REPO_PATH is not set")
+    bootstrap(args.remote_url, args.path, branch=args.branch, partial=not args.full)
@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from git import GitCommandError, Repo
+
+import coordination
+
+# Base blob id meaning "the file must not exist yet", as in `git update-ref`.
+NULL_BLOB = "0" * 40
+
+
+class ConflictError(Exception):
+    """Raised when a file changed since the editor loaded it."""
+
+    def __init__(self, path: str, current_content: str, current_blob: Optional[str]):
+        super().__init__(f"{path} was modified by someone else")
+        self.path = path
+        self.current_content = current_content
+        self.current_blob = current_blob
+
+
+def blob_id(data: bytes) -> str:
+    """Returns the git blob id of `data` without invoking git."""
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def file_blob_id(path: str) -> Optional[str]:
+    """Returns the git blob id of a file on disk, or None if it does not exist."""
+    try:
+        with open(path, 'rb') as f:
+            return blob_id(f.read())
+    except FileNotFoundError:
+        return None
+
+
+class PathLocks:
+    """Hands out one lock per path so writes to different files never wait on each other.
+
+    With `repo_path`, each lock is also held across worker processes.
+    """
+
+    def __init__(self, repo_path: Optional[str] = None):
+        self._repo_path = repo_path
+        self._guard = threading.Lock()
+        self._locks: Dict[str, List] = {}
+
+    @contextmanager
+    def hold(self, path: str):
+        with self._guard:
+            entry = self._locks.setdefault(path, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if self._repo_path is None:
+                    yield
+                else:
+                    with coordination.path_lock(self._repo_path, path):
+                        yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[path]
+
+
+def three_way_merge(repo: Repo, base_blob: Optional[str], ours: str, theirs: str) -> Tuple[str, int]:
+    """Merges two edits of the same file against the revision both started from.
+
+    Args:
+        repo (Repo): The site repository holding the base blob.
+        base_blob (Optional[str]): The blob id the editor was opened with.
+        ours (str): The content being saved.
+        theirs (str): The content currently on disk.
+
+    Returns:
+        Tuple[str, int]: The merged text (with diff3 conflict markers) and the number of conflicts.
+
+    """
+    base = ""
+    if base_blob and base_blob != NULL_BLOB:
+        try:
+            base = repo.git.cat_file("blob", base_blob, strip_newline_in_stdout=False)
+        except GitCommandError:
+            logging.warning(f"Base blob {base_blob} not found, merging without a common ancestor.")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = []
+        for name, text in (("yours", ours), ("base", base), ("current", theirs)):
+            file_path = os.path.join(tmp, name)
+            with open(file_path, 'w') as f:
+                f.write(text)
+            names.append(file_path)
+        status, merged, _ = repo.git.merge_file(
+            "-p", "--diff3", "-L", "yours", "-L", "base", "-L", "current", *names,
+            with_extended_output=True, with_exceptions=False, strip_newline_in_stdout=False,
+        )
+    if status < 0:
+        raise GitCommandError("git merge-file", status)
+    return merged, status
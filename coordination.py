@@ -0,0 +1,132 @@
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+
+class FileLock:
+    """An exclusive lock shared by every process on this machine.
+
+    The lock is an flock() on `path`, so it is released automatically if the
+    holding process dies. Each acquisition opens its own file description,
+    which makes the lock exclusive between threads of one process as well.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class LeaderLock:
+    """Makes one process on this machine the leader for a task until it exits.
+
+    The leader holds an flock() on `path` for the rest of its life. Other
+    processes try again each time they ask, so one of them takes over if
+    the leader dies.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def is_leader(self) -> bool:
+        """Returns True if this process is, or just became, the leader."""
+        if self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        f = open(self.path, 'a+')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+
+def lock_dir(repo_path: str) -> str:
+    """Returns the directory holding the admin's lock files for a repository."""
+    return os.path.join(repo_path, ".git", "zola-admin-locks")
+
+
+def path_lock(repo_path: str, rel_path: str) -> FileLock:
+    """Returns the cross-process lock guarding one file of a repository."""
+    digest = hashlib.sha1(rel_path.encode()).hexdigest()
+    return FileLock(os.path.join(lock_dir(repo_path), f"{digest}.lock"))
+
+
+def repo_lock(repo_path: str, name: str) -> FileLock:
+    """Returns a named cross-process lock for a repository-wide operation, e.g. "push"."""
+    return FileLock(os.path.join(lock_dir(repo_path), f"{name}.lock"))
+
+
+def leader_lock(repo_path: str, name: str) -> LeaderLock:
+    """Returns the lock electing the one process that performs task `name` for a repository."""
+    return LeaderLock(os.path.join(lock_dir(repo_path), f"{name}.leader"))
+
+
+class CacheSignals:
+    """Generation counters in SQLite that tell worker processes when to drop a cache.
+
+    A worker that changes shared state calls `bump(name)`; every worker
+    calls `changed(name)` before trusting its cached copy, which costs one
+    primary-key lookup on a connection each thread keeps open. The table is
+    created at startup, or else by the first check in a process.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_ready = False
+
+    @staticmethod
+    def ensure_schema(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_signals (
+                name TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            )
+        ''')
+
+    def bump(self, name: str):
+        """Tells all workers that the data behind cache `name` changed."""
+        with self._connect() as conn:
+            self.ensure_schema(conn)
+            conn.execute(
+                'INSERT INTO cache_signals (name, generation) VALUES (?, 1) '
+                'ON CONFLICT(name) DO UPDATE SET generation = generation + 1',
+                (name,),
+            )
+            conn.commit()
+
+    def changed(self, name: str) -> bool:
+        """Returns True if cache `name` was invalidated since this worker last asked."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        if not self._schema_ready:
+            # Also for scripts that use the registry without the app's startup
+            self.ensure_schema(conn)
+            conn.commit()
+            self._schema_ready = True
+        row = conn.execute('SELECT generation FROM cache_signals WHERE name = ?', (name,)).fetchone()
+        generation = row[0] if row else 0
+        with self._lock:
+            seen = self._seen.get(name)
+            self._seen[name] = generation
+        return seen is not None and seen != generation
@@ -0,0 +1,172 @@
+import ctypes
+import logging
+import os
+import stat
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# Set DURABLE_WRITES=0 to skip flushing to disk; writes then stay atomic but not crash-proof.
+DURABLE_WRITES = os.getenv("DURABLE_WRITES", "1").lower() not in ("0", "false", "no")
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    _libc = None
+
+# os.umask can only be read by setting it, so do that once at import time
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def syncfs_available() -> bool:
+    """Returns True if syncfs(2) can flush a whole filesystem in one call (Linux)."""
+    return _libc is not None and hasattr(_libc, "syncfs")
+
+
+class _Batch:
+    __slots__ = ("paths", "done", "error")
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self.done = False
+        self.error: Optional[OSError] = None
+
+
+class GroupSync:
+    """Flushes files to disk for many concurrent writers at once (group commit).
+
+    A writer adds its paths to the batch being collected and waits. If no
+    flush is running, it becomes the leader: it takes the batch and flushes
+    it while new writers collect in the next one. A flush therefore covers
+    everyone who arrived while the previous one was running, and the number
+    of disk flushes grows with disk latency rather than with the number of
+    saves.
+
+    With syncfs(2), a batch of several paths costs one call per filesystem,
+    which writes the dirty data of all of them with a single journal commit
+    and cache flush. A lone path, or any path where syncfs is missing, is
+    fsynced on its own.
+    """
+
+    def __init__(self, use_syncfs: Optional[bool] = None):
+        self.use_syncfs = syncfs_available() if use_syncfs is None else use_syncfs
+        self._cond = threading.Condition()
+        self._collecting = _Batch()
+        self._flushing = False
+        self.flushes = 0
+        self.synced_paths = 0
+
+    def sync(self, paths: Iterable[str]):
+        """Returns once `paths` (files or directories) are on disk.
+
+        Raises:
+            OSError: If flushing the batch containing `paths` failed.
+
+        """
+        with self._cond:
+            batch = self._collecting
+            batch.paths.extend(paths)
+            while not batch.done:
+                if not self._flushing:
+                    # Nobody took our batch yet, so lead it
+                    self._flushing = True
+                    self._collecting = _Batch()
+                    break
+                self._cond.wait()
+            else:
+                if batch.error is not None:
+                    raise batch.error
+                return
+
+        try:
+            self._flush(batch.paths)
+        except OSError as e:
+            logging.error(f"Failed to flush {len(batch.paths)} files to disk: {str(e)}")
+            batch.error = e
+        with self._cond:
+            batch.done = True
+            self._flushing = False
+            self.flushes += 1
+            self.synced_paths += len(batch.paths)
+            self._cond.notify_all()
+        if batch.error is not None:
+            raise batch.error
+
+    def _flush(self, paths: List[str]):
+        by_device: Dict[int, List[str]] = {}
+        for path in dict.fromkeys(paths):
+            by_device.setdefault(os.stat(path).st_dev, []).append(path)
+        for device_paths in by_device.values():
+            # syncfs also writes unrelated dirty data, so it only pays off for several paths
+            if self.use_syncfs and len(device_paths) > 1:
+                _sync_filesystem(device_paths[0])
+            else:
+                for path in device_paths:
+                    _fsync_path(path)
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sync_filesystem(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if _libc.syncfs(fd) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+    finally:
+        os.close(fd)
+
+
+default_sync = GroupSync()
+
+
+def write_file(path: str, data: bytes, durable: Optional[bool] = None, syncer: Optional[GroupSync] = None):
+    """Replaces the content of a file so that a crash leaves either the old or the new version.
+
+    The data goes to a temporary file next to `path`, which is flushed to
+    disk and then renamed over `path`; the rename is flushed as well. An
+    existing file keeps its permissions. The temporary name starts with a
+    dot and ends in ".tmp", so the file watcher ignores it.
+
+    Args:
+        path (str): The file to write; missing parent directories are created.
+        data (bytes): The new content.
+        durable (Optional[bool]): Whether to wait until the write is on disk,
+            defaulting to DURABLE_WRITES.
+        syncer (Optional[GroupSync]): The group to flush with, defaulting to `default_sync`.
+
+    Raises:
+        OSError: If writing, flushing or renaming fails; `path` is then unchanged.
+
+    """
+    durable = DURABLE_WRITES if durable is None else durable
+    syncer = syncer or default_sync
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        if durable:
+            syncer.sync([tmp_path])
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    if durable:
+        syncer.sync([directory])
@@ -0,0 +1,294 @@
+import asyncio
+import ctypes
+import errno
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+# The directories of a site that are watched, relative to the repository.
+WATCHED_PATHS = ("content", "templates")
+
+# A batch is emitted once no event arrived for QUIET_SECONDS, or MAX_DELAY_SECONDS
+# after its first event while events keep coming.
+QUIET_SECONDS = 0.25
+MAX_DELAY_SECONDS = 2.0
+# Larger batches, e.g. from a checkout, are sent as a single "rescan" instead of per path.
+MAX_BATCH_PATHS = 500
+
+# Constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    _libc = None
+
+
+class ChangeBatch(NamedTuple):
+    """Coalesced changes below the watched directories of one site.
+
+    `paths` holds repository-relative paths such as "content/blog/post.md",
+    or is None when too much changed to list (or events were lost) and
+    everything derived from the site should be refreshed.
+    """
+    site: str
+    paths: Optional[FrozenSet[str]]
+
+    def to_json(self) -> str:
+        return json.dumps({"site": self.site, "paths": sorted(self.paths) if self.paths is not None else None})
+
+
+def watcher_enabled() -> bool:
+    """Returns False if FS_WATCHER turns the watcher off or inotify is not available."""
+    if os.getenv("FS_WATCHER", "1").lower() in ("0", "false", "no"):
+        return False
+    return _libc is not None and hasattr(_libc, "inotify_init1")
+
+
+def _ignored(name: str) -> bool:
+    # Editor swap files and the temporary files of atomic writes
+    return name.startswith(".") or name.endswith(("~", ".swp", ".part", ".tmp"))
+
+
+class Watcher:
+    """Watches the content and templates of every site from one inotify instance and thread.
+
+    inotify does not watch subdirectories, so each directory gets its own
+    watch and new directories are added as they appear. The files below
+    them are remembered, so a directory that is moved away can report the
+    files it took along. Events are collected per site and handed to
+    subscribers as ChangeBatch objects from the watcher thread.
+    """
+
+    def __init__(self):
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+        self._watches: Dict[int, Tuple[str, str, str]] = {}  # wd -> (site, repo_path, directory)
+        self._files: Dict[str, Set[str]] = {}  # site -> files below its watched directories
+        self._roots: Dict[str, str] = {}
+        self._subscribers: List[Callable[[ChangeBatch], None]] = []
+        self._pending: Dict[str, Set[str]] = {}
+        self._overflowed: Set[str] = set()
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback: Callable[[ChangeBatch], None]):
+        """Registers a callback for change batches; it runs on the watcher thread."""
+        self._subscribers.append(callback)
+
+    def add_site(self, site: str, repo_path: str):
+        """Starts watching the content and templates of a site; does nothing if already watched."""
+        with self._lock:
+            if site in self._roots:
+                return
+            if self._fd is None:
+                self._fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if self._fd < 0:
+                    raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            self._roots[site] = repo_path
+        for top in WATCHED_PATHS:
+            self._watch_tree(site, repo_path, os.path.join(repo_path, top))
+
+    def _watch_tree(self, site: str, repo_path: str, directory: str) -> List[str]:
+        """Adds watches for `directory` and everything below it; returns the files found."""
+        found = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not _ignored(d)]
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(root), _WATCH_MASK | IN_ONLYDIR)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logging.error("Out of inotify watches; raise fs.inotify.max_user_watches to watch all directories.")
+                    break
+                continue
+            with self._lock:
+                self._watches[wd] = (site, repo_path, root)
+            found.extend(os.path.join(root, f) for f in files if not _ignored(f))
+        with self._lock:
+            self._files.setdefault(site, set()).update(found)
+        return found
+
+    def _forget_tree(self, site: str, directory: str) -> List[str]:
+        """Drops the watches and files below a directory that left the tree; returns the files."""
+        prefix = directory + os.sep
+        with self._lock:
+            wds = [wd for wd, (s, _, d) in self._watches.items()
+                   if s == site and (d == directory or d.startswith(prefix))]
+            for wd in wds:
+                del self._watches[wd]
+            files = self._files.get(site, set())
+            gone = [f for f in files if f.startswith(prefix)]
+            files.difference_update(gone)
+        for wd in wds:
+            # Fails harmlessly for directories that were deleted, whose watches are already gone
+            _libc.inotify_rm_watch(self._fd, wd)
+        return gone
+
+    def start(self):
+        """Starts the watcher thread once a site is being watched."""
+        if self._thread is None and self._fd is not None:
+            self._thread = threading.Thread(target=self._run, name="fs-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while not self._stop.is_set():
+            timeout = None if not self._has_pending() else max(0.0, self._flush_due() - time.monotonic())
+            # Wake up regularly so stop() is noticed
+            events = poller.poll(1000 if timeout is None else min(timeout, 1.0) * 1000)
+            if events:
+                self._read_events()
+            if self._has_pending() and time.monotonic() >= self._flush_due():
+                self._flush()
+
+    def _has_pending(self) -> bool:
+        return bool(self._pending or self._overflowed)
+
+    def _flush_due(self) -> float:
+        return min(self._last_event + QUIET_SECONDS, self._first_event + MAX_DELAY_SECONDS)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        now = time.monotonic()
+        if not self._has_pending():
+            self._first_event = now
+        self._last_event = now
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += length
+            self._handle_event(wd, mask, name)
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped, so nothing is known about what changed
+            logging.warning("inotify queue overflowed; rescanning all sites.")
+            self._overflowed.update(self._roots)
+            return
+        with self._lock:
+            watch = self._watches.get(wd)
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+        if watch is None or (name and _ignored(name)):
+            return
+        site, repo_path, directory = watch
+        path = os.path.join(directory, name) if name else directory
+
+        changed = [path]
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            # Files may have been created before the new directory was watched
+            changed += self._watch_tree(site, repo_path, path)
+        elif mask & IN_ISDIR and mask & (IN_MOVED_FROM | IN_DELETE):
+            # A directory moved out reports no events for its files, which are gone all the same
+            changed += self._forget_tree(site, path)
+        elif name:
+            with self._lock:
+                files = self._files.setdefault(site, set())
+                if mask & (IN_MOVED_FROM | IN_DELETE):
+                    files.discard(path)
+                else:
+                    files.add(path)
+        self._add_pending(site, [os.path.relpath(p, repo_path).replace(os.sep, "/") for p in changed])
+
+    def _add_pending(self, site: str, paths: List[str]):
+        if site in self._overflowed:
+            return
+        pending = self._pending.setdefault(site, set())
+        pending.update(paths)
+        if len(pending) > MAX_BATCH_PATHS:
+            del self._pending[site]
+            self._overflowed.add(site)
+
+    def _flush(self):
+        batches = [ChangeBatch(site, frozenset(paths)) for site, paths in self._pending.items()]
+        batches += [ChangeBatch(site, None) for site in self._overflowed]
+        self._pending, self._overflowed = {}, set()
+        for batch in batches:
+            for callback in self._subscribers:
+                try:
+                    callback(batch)
+                except Exception as e:
+                    logging.error(f"Change subscriber failed for {batch.site}: {str(e)}")
+
+
+class EventHub:
+    """Fans change batches out to server-sent event streams on the event loop.
+
+    Each open page gets a bounded queue; a client that falls behind gets a
+    single rescan event instead of an ever-growing backlog.
+    """
+
+    KEEPALIVE_SECONDS = 15
+    QUEUE_SIZE = 50
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Set[Tuple[str, asyncio.Queue]] = set()
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, batch: ChangeBatch):
+        """Queues a batch for all streams of its site; safe to call from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._fan_out, batch)
+
+    def _fan_out(self, batch: ChangeBatch):
+        for site, queue in list(self._clients):
+            if site != batch.site:
+                continue
+            try:
+                queue.put_nowait(batch)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(ChangeBatch(site, None))
+
+    async def stream(self, site: str, is_disconnected: Callable):
+        """Yields server-sent events for one client until it disconnects."""
+        client = (site, asyncio.Queue(maxsize=self.QUEUE_SIZE))
+        self._clients.add(client)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    batch = await asyncio.wait_for(client[1].get(), self.KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: change\ndata: {batch.to_json()}\n\n"
+        finally:
+            self._clients.discard(client)
@@ -2,6 +2,8 @@ import os
 
 import git
 
+import git_objects
+
 # Path to your Git repository (local path)
 git_repo_path = os.getenv("GIT_REPO_PATH", "default_git_repo_path")
 
@@ -12,77 +14,107 @@ def get_repo():
     """Returns the initialized Git repository."""
     return repo
 
-def add_file(file_path):
+# Every function below acts on GIT_REPO_PATH unless given another site's
+# repository as `site_repo`.
+
+def _relative_path(site_repo, file_path):
+    """Returns `file_path` relative to the repository root."""
+    if os.path.isabs(file_path):
+        return os.path.relpath(file_path, site_repo.working_tree_dir)
+    return file_path
+
+def _read_file(site_repo, rel_path):
+    """Reads a file from the working tree, returning None if it no longer exists."""
+    try:
+        with open(os.path.join(site_repo.working_tree_dir, rel_path), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def add_file(file_path, site_repo=None):
     """Adds a file to the repository and commits the change.
 
     Args:
         file_path (str): The path to the file to add.
+        site_repo (git.Repo, optional): The repository to commit to.
 
     """
+    site_repo = site_repo or repo
     try:
-        repo.index.add([file_path])
-        repo.index.commit(f'Add {file_path}')
-        push_changes()  # Push changes after committing
+        rel_path = _relative_path(site_repo, file_path)
+        git_objects.commit_changes(site_repo, {rel_path: _read_file(site_repo, rel_path)}, f'Add {file_path}')
+        push_changes(site_repo)  # Push changes after committing
     except Exception as e:
         print(f"Error adding file: {e}")
 
-def remove_file(file_path):
+def remove_file(file_path, site_repo=None):
     """Removes a file from the repository and commits the change.
 
     Args:
         file_path (str): The path to the file to remove.
+        site_repo (git.Repo, optional): The repository to commit to.
 
     """
+    site_repo = site_repo or repo
     try:
-        repo.index.remove([file_path])
-        repo.index.commit(f'Remove {file_path}')
-        push_changes()  # Push changes after committing
+        git_objects.commit_changes(site_repo, {_relative_path(site_repo, file_path): None}, f'Remove {file_path}')
+        push_changes(site_repo)  # Push changes after committing
     except Exception as e:
         print(f"Error removing file: {e}")
 
-def push_changes():
+def push_changes(site_repo=None):
     """Pushes changes to the remote repository."""
+    site_repo = site_repo or repo
     try:
-        origin = repo.remote(name='origin')
+        origin = site_repo.remote(name='origin')
         origin.push()  # Push to the remote repository
     except Exception as e:
         print(f"Error pushing changes: {e}")
 
-def list_files():
+def list_files(site_repo=None):
     """Lists all files in the repository.
 
     Returns:
         list: A list of file paths in the repository.
 
     """
-    return [item.path for item in repo.tree().traverse()]
+    site_repo = site_repo or repo
+    return [item.path for item in site_repo.tree().traverse()]
 
-def commit_changes(message: str):
+def commit_changes(message: str, site_repo=None):
     """Commits all changes in the repository with a provided message and pushes the changes.
 
     Args:
         message (str): The commit message.
+        site_repo (git.Repo, optional): The repository to commit to.
 
     """
+    site_repo = site_repo or repo
     try:
-        repo.git.add(A=True)  # Stage all changes
-        repo.index.commit(message)  # Commit with the provided message
-        push_changes()  # Push changes to remote
+        # Modified, deleted and untracked files relative to HEAD
+        changed = site_repo.git.diff("HEAD", "--name-only", "-z").split("\0")
+        untracked = site_repo.git.ls_files("--others", "--exclude-standard", "-z").split("\0")
+        changes = {path: _read_file(site_repo, path) for path in changed + untracked if path}
+        if changes:
+            git_objects.commit_changes(site_repo, changes, message)
+        push_changes(site_repo)  # Push changes to remote
     except Exception as e:
         print(f"Error committing changes: {e}")
 
 # Function to commit specific template changes
-def commit_template_changes(template_name: str, message: str):
+def commit_template_changes(template_name: str, message: str, site_repo=None):
     """Commits changes to a specific template file.
 
     Args:
         template_name (str): The name of the template file to commit.
         message (str): The commit message.
+        site_repo (git.Repo, optional): The repository to commit to.
 
     """
+    site_repo = site_repo or repo
     try:
-        repo.index.add([f"templates/{template_name}"])  # Adjust the path accordingly
-        repo.index.commit(message)
-        push_changes()  # Push changes to remote
+        rel_path = f"templates/{template_name}"  # Adjust the path accordingly
+        git_objects.commit_changes(site_repo, {rel_path: _read_file(site_repo, rel_path)}, message)
+        push_changes(site_repo)  # Push changes to remote
     except Exception as e:
         print(f"Error committing template changes: {e}")
@@ -0,0 +1,247 @@
+import logging
+import os
+import random
+import threading
+import time
+from io import BytesIO
+from typing import Dict, Optional, Union
+
+from git import Actor, GitCommandError, Repo
+from git.objects.fun import tree_entries_from_data, tree_to_stream
+from gitdb import IStream
+from gitdb.db import LooseObjectDB
+from gitdb.util import bin_to_hex, hex_to_bin
+
+import coordination
+
+# How often a commit is rebuilt on top of a branch head that moved underneath it.
+MAX_COMMIT_ATTEMPTS = 20
+
+TREE_MODE = 0o40000
+FILE_MODE = 0o100644
+
+
+class StaleBlobError(Exception):
+    """Raised when files passed to `commit_changes` changed on the branch since they were read."""
+
+    def __init__(self, paths):
+        super().__init__(f"Changed on the branch: {', '.join(sorted(paths))}")
+        self.paths = paths
+
+
+def _store(objects: LooseObjectDB, type_name: bytes, data: bytes) -> bytes:
+    """Writes one object to the loose object store in-process and returns its binary id."""
+    return objects.store(IStream(type_name, len(data), BytesIO(data))).binsha
+
+
+class FileBlob:
+    """File content for `commit_changes` that is streamed from disk instead of held in memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+
+def _store_blob(objects: LooseObjectDB, data: Union[bytes, FileBlob]) -> bytes:
+    if isinstance(data, FileBlob):
+        with open(data.path, 'rb') as f:
+            return objects.store(IStream(b"blob", os.fstat(f.fileno()).st_size, f)).binsha
+    return _store(objects, b"blob", data)
+
+
+def _tree_sort_key(entry) -> bytes:
+    # Git orders tree entries as if directory names ended with a slash.
+    _, mode, name = entry
+    return (name + "/" if mode == TREE_MODE else name).encode()
+
+
+def _nest(changes: Dict[str, Optional[bytes]]) -> Dict:
+    """Turns {"a/b/c.md": blob_id} into {"a": {"b": {"c.md": blob_id}}}."""
+    nested: Dict = {}
+    for path, data in changes.items():
+        parts = path.replace(os.sep, "/").strip("/").split("/")
+        node = nested
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = data
+    return nested
+
+
+def _rewrite_tree(repo: Repo, objects: LooseObjectDB, tree_binsha: Optional[bytes], changes: Dict,
+                  expected: Optional[Dict] = None, stale: Optional[list] = None, prefix: str = "") -> Optional[bytes]:
+    """Returns the id of `tree_binsha` with `changes` applied, or None for a subtree that ends up empty.
+
+    Only the trees along the changed paths are read and written; untouched
+    subtrees are reused by id. Paths whose current blob differs from the id
+    in `expected` (nested like `changes`) are added to `stale`.
+    """
+    entries = {}
+    if tree_binsha is not None:
+        data = repo.odb.stream(tree_binsha).read()
+        entries = {name: (binsha, mode) for binsha, mode, name in tree_entries_from_data(data)}
+
+    for name, change in changes.items():
+        existing = entries.get(name)
+        if isinstance(change, dict):
+            subtree = existing[0] if existing and existing[1] == TREE_MODE else None
+            new_subtree = _rewrite_tree(repo, objects, subtree, change, (expected or {}).get(name), stale,
+                                        f"{prefix}{name}/")
+            if new_subtree is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = (new_subtree, TREE_MODE)
+            continue
+
+        if expected and name in expected:
+            current = bin_to_hex(existing[0]).decode() if existing and existing[1] != TREE_MODE else None
+            if current != expected[name]:
+                stale.append(prefix + name)
+        if change is None:
+            entries.pop(name, None)
+        else:
+            mode = existing[1] if existing and existing[1] != TREE_MODE else FILE_MODE
+            entries[name] = (change, mode)
+
+    if not entries and prefix:
+        # Git has no empty subtrees, also not for a directory that never existed
+        return None
+    stream = BytesIO()
+    tree_to_stream(sorted(((b, m, n) for n, (b, m) in entries.items()), key=_tree_sort_key), stream.write)
+    return _store(objects, b"tree", stream.getvalue())
+
+
+def _signature(actor: Actor) -> str:
+    offset = time.localtime().tm_gmtoff
+    sign = "+" if offset >= 0 else "-"
+    hours, minutes = divmod(abs(offset) // 60, 60)
+    return f"{actor.name} <{actor.email}> {int(time.time())} {sign}{hours:02d}{minutes:02d}"
+
+
+def commit_changes(repo: Repo, changes: Dict[str, Optional[Union[bytes, FileBlob]]], message: str,
+                   author: Optional[Actor] = None, expected: Optional[Dict[str, Optional[str]]] = None) -> str:
+    """Commits file changes directly to the object database, bypassing index and working tree.
+
+    Blobs, the trees along each changed path and the commit are written
+    in-process, so the cost depends on the depth of the changed paths rather
+    than on the size of the repository. The branch ref is moved with a
+    compare-and-swap; if another commit lands first, the changes are
+    re-applied on the new head. The shared index is synced in the background.
+
+    Args:
+        repo (Repo): The site repository.
+        changes (Dict[str, Optional[Union[bytes, FileBlob]]]): New file contents keyed by
+            repository-relative path; None deletes the file.
+        message (str): The commit message.
+        author (Optional[Actor]): The commit author, defaulting to the configured git identity.
+        expected (Optional[Dict[str, Optional[str]]]): Blob ids the changed files must still
+            have on the branch (None for "does not exist"), for changes computed from
+            content read earlier.
+
+    Returns:
+        str: The id of the new commit.
+
+    Raises:
+        StaleBlobError: If a file no longer matches `expected`; nothing is committed.
+
+    """
+    objects = LooseObjectDB(os.path.join(repo.common_dir, "objects"))
+    # Blobs do not depend on the parent, so they are written once for all attempts
+    nested = _nest({
+        path: None if data is None else _store_blob(objects, data)
+        for path, data in changes.items()
+    })
+    expected_nested = _nest(expected) if expected else None
+    ref = repo.head.ref.path
+    config = repo.config_reader()
+    committer = Actor.committer(config)
+    author = author or Actor.author(config)
+
+    for attempt in range(MAX_COMMIT_ATTEMPTS):
+        parent = repo.git.rev_parse(ref)
+        # The first line of a commit object is "tree <id>"
+        parent_tree = repo.odb.stream(hex_to_bin(parent)).read().split(b"\n", 1)[0].split(b" ")[1]
+        stale = []
+        tree = _rewrite_tree(repo, objects, hex_to_bin(parent_tree), nested, expected_nested, stale)
+        if stale:
+            raise StaleBlobError(stale)
+        tree = tree or _store(objects, b"tree", b"")
+        commit_data = (
+            f"tree {bin_to_hex(tree).decode()}\n"
+            f"parent {parent}\n"
+            f"author {_signature(author)}\n"
+            f"committer {_signature(committer)}\n"
+            f"\n{message}\n"
+        ).encode()
+        commit = bin_to_hex(_store(objects, b"commit", commit_data)).decode()
+        try:
+            repo.git.update_ref(ref, commit, parent)
+        except GitCommandError:
+            logging.info(f"{ref} moved while committing, retrying (attempt {attempt + 1}).")
+            # Jittered backoff so competing writers stop colliding on every retry
+            time.sleep(random.uniform(0, 0.005 * 2 ** min(attempt, 6)))
+            continue
+        schedule_index_sync(repo.working_tree_dir)
+        return commit
+    raise RuntimeError(f"Could not update {ref} after {MAX_COMMIT_ATTEMPTS} attempts")
+
+
+class _IndexSync:
+    """Resets the shared index of each repository to HEAD from one background thread.
+
+    Bursts of commits collapse into a single reset, which is the only step
+    whose cost grows with the size of the working tree.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()
+        self._pending = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, repo_path: str):
+        with self._lock:
+            self._pending.add(repo_path)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="git-index-sync", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def flush(self, repo_path: str):
+        with self._lock:
+            self._pending.discard(repo_path)
+        self._sync(repo_path)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                repo_path = self._pending.pop()
+            self._sync(repo_path)
+
+    def _sync(self, repo_path: str):
+        try:
+            with self._sync_lock, index_sync_lock(repo_path):
+                # Unlike `git reset`, read-tree never writes refs, so it cannot race with commits
+                Repo(repo_path).git.read_tree("--reset", "HEAD")
+        except GitCommandError as e:
+            # A stale index only affects `git status`; the next sync fixes it.
+            logging.warning(f"Failed to sync the index of {repo_path} with HEAD: {str(e)}")
+
+
+_index_sync = _IndexSync()
+
+
+def schedule_index_sync(repo_path: str):
+    """Queues a background reset of the shared index to HEAD."""
+    _index_sync.schedule(repo_path)
+
+
+def index_sync_lock(repo_path: str) -> coordination.FileLock:
+    """Returns the lock held while the shared index is reset; hold it to keep resets out of a git command."""
+    return coordination.repo_lock(repo_path, "index-sync")
+
+
+def flush_index_sync(repo_path: str):
+    """Syncs the shared index now; call before git commands that rely on it, such as pull."""
+    _index_sync.flush(repo_path)
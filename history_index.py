@@ -0,0 +1,252 @@
+import logging
+import re
+import sqlite3
+from typing import Dict, List, Optional
+
+from git import Repo
+
+# Only the parts of the site the admin edits are indexed.
+HISTORY_PATHS = ("content", "templates")
+
+_RECORD_SEP = "\x1e"
+_FIELD_SEP = "\x1f"
+_LOG_FORMAT = f"{_RECORD_SEP}%H{_FIELD_SEP}%an{_FIELD_SEP}%ae{_FIELD_SEP}%at{_FIELD_SEP}%s"
+_SHA = re.compile(r"[0-9a-f]{40}")
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the history index tables if they do not exist yet.
+
+    Args:
+        conn (sqlite3.Connection): An open connection to the admin database.
+
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(history_files)')]
+    if columns and "site" not in columns:
+        # Index from before multi-site support; it is derived data, so rebuild it
+        conn.executescript('''
+            DROP TABLE history_commits;
+            DROP TABLE history_files;
+            DROP TABLE history_state;
+        ''')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS history_commits (
+            site TEXT NOT NULL,
+            sha TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            author_name TEXT NOT NULL,
+            author_email TEXT NOT NULL,
+            authored_at INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            PRIMARY KEY (site, sha)
+        );
+        CREATE TABLE IF NOT EXISTS history_files (
+            site TEXT NOT NULL,
+            path TEXT NOT NULL,
+            sha TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            change_type TEXT NOT NULL,
+            old_path TEXT,
+            PRIMARY KEY (site, path, sha)
+        );
+        CREATE INDEX IF NOT EXISTS ix_history_files_path_seq
+            ON history_files (site, path, seq DESC);
+        CREATE TABLE IF NOT EXISTS history_state (
+            site TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            head_sha TEXT NOT NULL,
+            PRIMARY KEY (site, ref)
+        );
+    ''')
+
+
+def _parse_log(output: str) -> List[Dict]:
+    """Parses `git log --name-status` output produced with `_LOG_FORMAT`."""
+    commits = []
+    for record in output.split(_RECORD_SEP):
+        lines = [line for line in record.split("\n") if line]
+        if not lines:
+            continue
+        sha, author_name, author_email, authored_at, summary = lines[0].split(_FIELD_SEP, 4)
+        files = []
+        for line in lines[1:]:
+            parts = line.split("\t")
+            status = parts[0][:1]
+            if status in ("R", "C") and len(parts) == 3:
+                files.append((parts[2], status, parts[1]))
+            elif len(parts) == 2:
+                files.append((parts[1], status, None))
+        commits.append({
+            "sha": sha,
+            "author_name": author_name,
+            "author_email": author_email,
+            "authored_at": int(authored_at),
+            "summary": summary,
+            "files": files,
+        })
+    return commits
+
+
+def update_index(conn: sqlite3.Connection, repo: Repo, site: str, ref: str = "HEAD") -> int:
+    """Indexes the commits reachable from `ref` that are not indexed yet.
+
+    Only the commits between the last indexed head and the current one are
+    read from git, so a call with nothing new costs a single `rev-parse`. If
+    the branch was rewritten (the old head is no longer an ancestor), the
+    index is rebuilt from scratch.
+
+    Args:
+        conn (sqlite3.Connection): An open connection to the admin database.
+        repo (Repo): The site repository.
+        site (str): The slug of the site the repository belongs to.
+        ref (str): The ref whose history is indexed.
+
+    Returns:
+        int: The number of newly indexed commits.
+
+    """
+    ensure_schema(conn)
+    head = repo.git.rev_parse(ref)
+    row = conn.execute('SELECT head_sha FROM history_state WHERE site = ? AND ref = ?', (site, ref)).fetchone()
+    last = row[0] if row else None
+    if last == head:
+        return 0
+
+    if last and repo.is_ancestor(last, head):
+        revision_range = f"{last}..{head}"
+    else:
+        if last:
+            logging.info(f"History of {ref} in {site} was rewritten, rebuilding the history index.")
+        conn.execute('DELETE FROM history_files WHERE site = ?', (site,))
+        conn.execute('DELETE FROM history_commits WHERE site = ?', (site,))
+        revision_range = head
+
+    output = repo.git.log(
+        revision_range, "--reverse", "--topo-order", "--name-status", "-M", f"--format={_LOG_FORMAT}",
+        "--", *HISTORY_PATHS,
+    )
+    commits = _parse_log(output)
+
+    # Commits are numbered in topological order so history sorts correctly
+    # even when several commits share the same timestamp.
+    start = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM history_commits WHERE site = ?', (site,)).fetchone()[0] + 1
+    for seq, commit in enumerate(commits, start):
+        commit["seq"] = seq
+
+    conn.executemany(
+        'INSERT OR IGNORE INTO history_commits (site, sha, seq, author_name, author_email, authored_at, summary) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(site, c["sha"], c["seq"], c["author_name"], c["author_email"], c["authored_at"], c["summary"]) for c in commits],
+    )
+    conn.executemany(
+        'INSERT OR IGNORE INTO history_files (site, path, sha, seq, change_type, old_path) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(site, path, c["sha"], c["seq"], change_type, old_path)
+         for c in commits for path, change_type, old_path in c["files"]],
+    )
+    conn.execute(
+        'INSERT INTO history_state (site, ref, head_sha) VALUES (?, ?, ?) '
+        'ON CONFLICT(site, ref) DO UPDATE SET head_sha = excluded.head_sha',
+        (site, ref, head),
+    )
+    conn.commit()
+    logging.info(f"Indexed {len(commits)} new commit(s) for {ref} in {site}.")
+    return len(commits)
+
+
+def rebuild_index(conn: sqlite3.Connection, repo: Repo, site: str, ref: str = "HEAD") -> int:
+    """Drops the history index of a site and indexes all commits reachable from `ref` again.
+
+    Returns:
+        int: The number of indexed commits.
+
+    """
+    ensure_schema(conn)
+    conn.execute('DELETE FROM history_files WHERE site = ?', (site,))
+    conn.execute('DELETE FROM history_commits WHERE site = ?', (site,))
+    conn.execute('DELETE FROM history_state WHERE site = ? AND ref = ?', (site, ref))
+    return update_index(conn, repo, site, ref)
+
+
+def file_history(conn: sqlite3.Connection, site: str, path: str, follow_renames: bool = True) -> List[sqlite3.Row]:
+    """Returns the indexed revisions of a file, newest first.
+
+    Each path segment of the history is one indexed query; renames are
+    followed by continuing with the old path from the commit that renamed it.
+
+    Args:
+        conn (sqlite3.Connection): An open connection to the admin database.
+        site (str): The slug of the site the file belongs to.
+        path (str): The repository-relative path of the file.
+        follow_renames (bool): Whether to include history from before a rename.
+
+    Returns:
+        List[sqlite3.Row]: One row per commit touching the file.
+
+    """
+    ensure_schema(conn)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    history = []
+    seen = set()
+    before: Optional[int] = None
+    while path and path not in seen:
+        seen.add(path)
+        rows = cursor.execute(
+            'SELECT f.path, f.sha, f.seq, f.change_type, f.old_path, '
+            'c.authored_at, c.author_name, c.author_email, c.summary '
+            'FROM history_files f JOIN history_commits c ON c.site = f.site AND c.sha = f.sha '
+            'WHERE f.site = ? AND f.path = ? AND (? IS NULL OR f.seq < ?) '
+            'ORDER BY f.seq DESC',
+            (site, path, before, before),
+        ).fetchall()
+        history.extend(rows)
+        renamed = next((r for r in rows if r["change_type"] == "R"), None)
+        if not follow_renames or renamed is None:
+            break
+        path, before = renamed["old_path"], renamed["seq"]
+    return history
+
+
+def revision_paths(conn: sqlite3.Connection, site: str, path: str) -> Dict[str, str]:
+    """Maps the indexed commits touching a file to the path the file had in each, following renames."""
+    return {row["sha"]: row["path"] for row in file_history(conn, site, path)}
+
+
+def _check_sha(sha: str):
+    # Anything else could be read by git as an option or a revision expression
+    if not _SHA.fullmatch(sha):
+        raise ValueError(f"Not a full commit id: {sha!r}")
+
+
+def file_at_revision(repo: Repo, path: str, sha: str) -> str:
+    """Returns the content of `path` as of commit `sha`.
+
+    Raises:
+        ValueError: If `sha` is not a full, lower-case commit id.
+
+    """
+    _check_sha(sha)
+    return repo.git.show("--end-of-options", f"{sha}:{path}", strip_newline_in_stdout=False)
+
+
+def diff_revisions(repo: Repo, old_sha: str, new_sha: str, old_path: str, new_path: Optional[str] = None) -> str:
+    """Returns a unified diff of a file between two revisions.
+
+    Args:
+        repo (Repo): The site repository.
+        old_sha (str): The older revision, a full commit id.
+        new_sha (str): The newer revision, a full commit id.
+        old_path (str): The path of the file in the older revision.
+        new_path (Optional[str]): The path in the newer revision if it was renamed.
+
+    Returns:
+        str: The diff text, empty when the revisions are identical.
+
+    Raises:
+        ValueError: If a revision is not a full, lower-case commit id.
+
+    """
+    _check_sha(old_sha)
+    _check_sha(new_sha)
+    return repo.git.diff("--end-of-options", f"{old_sha}:{old_path}", f"{new_sha}:{new_path or old_path}")
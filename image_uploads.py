@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import git_objects
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only originals are stored
+    Image = None
+
+# Where uploads are kept, outside any site repository and shared between sites.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+
+# Where committed assets live in a site repository, and the URL Zola serves them at.
+SITE_ASSET_DIR = "static/images/uploads"
+SITE_ASSET_URL = "/images/uploads"
+
+ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+VARIANT_WIDTHS = (480, 960, 1600)
+
+# How long a save waits for variants of an image uploaded moments before.
+VARIANT_WAIT_SECONDS = 30
+# Variants still pending after this long are given up on, e.g. because the
+# worker that rendered them was restarted.
+RENDER_TIMEOUT_SECONDS = int(os.getenv("RENDER_TIMEOUT_SECONDS", 120))
+# Room for the multipart framing around an upload of UPLOAD_MAX_BYTES.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+CHUNK_SIZE = 1024 * 1024
+
+_ASSET_URL_PATTERN = re.compile(re.escape(SITE_ASSET_URL) + r"/([0-9a-f]{64})(?:-\d+)?\.(\w+)")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class UploadError(Exception):
+    """Raised for uploads that are rejected."""
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the uploads table if it does not exist yet."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            digest TEXT PRIMARY KEY,
+            extension TEXT NOT NULL,
+            original_name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _store_path(digest: str, suffix: str) -> str:
+    return os.path.join(UPLOAD_DIR, digest[:2], f"{digest}{suffix}")
+
+
+def save_upload(source: BinaryIO, filename: str) -> Tuple[str, str, int, bool]:
+    """Streams an upload into the content-addressed store.
+
+    The data is copied in chunks to a temporary file while it is hashed, so
+    memory use does not depend on the file size. Identical uploads end up at
+    the same path and are stored once.
+
+    Args:
+        source (BinaryIO): The uploaded file.
+        filename (str): The name the file was uploaded with.
+
+    Returns:
+        Tuple[str, str, int, bool]: The SHA-256 digest, the file extension, the size,
+            and whether the content was new to the store.
+
+    Raises:
+        UploadError: If the file type is not allowed or the file is too large.
+
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise UploadError(f"Unsupported image type: {extension or 'none'}")
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise UploadError(f"Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MiB")
+                digest.update(chunk)
+                out.write(chunk)
+        hexdigest = digest.hexdigest()
+        final_path = _store_path(hexdigest, extension)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            return hexdigest, extension, size, False
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        return hexdigest, extension, size, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def render_variants(source_path: str, digest: str) -> List[str]:
+    """Writes a WebP copy and resized WebP variants of an image next to it.
+
+    Runs in a worker process of the image pool.
+
+    Returns:
+        List[str]: The paths of the variants written.
+
+    """
+    written = []
+    directory = os.path.dirname(source_path)
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        targets = [(None, os.path.join(directory, f"{digest}.webp"))]
+        targets += [(w, os.path.join(directory, f"{digest}-{w}.webp")) for w in VARIANT_WIDTHS if w < image.width]
+        for width, path in targets:
+            variant = image
+            if width:
+                variant = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            variant.save(path + ".part", "WEBP", quality=82)
+            os.replace(path + ".part", path)
+            written.append(path)
+    return written
+
+
+def _image_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+    return _pool
+
+
+def _submit_render(source_path: str, digest: str):
+    global _pool
+    try:
+        return _image_pool().submit(render_variants, source_path, digest)
+    except BrokenProcessPool:
+        # A worker process died; start over with a fresh pool
+        _pool = None
+        return _image_pool().submit(render_variants, source_path, digest)
+
+
+def fail_stale_renders(connect) -> int:
+    """Marks uploads whose variants are pending for longer than RENDER_TIMEOUT_SECONDS as failed.
+
+    Returns:
+        int: The number of uploads given up on.
+
+    """
+    with connect() as conn:
+        ensure_schema(conn)
+        failed = conn.execute(
+            "UPDATE uploads SET status = 'failed' WHERE status = 'pending' AND created_at < datetime('now', ?)",
+            (f"-{RENDER_TIMEOUT_SECONDS} seconds",),
+        ).rowcount
+        conn.commit()
+    if failed:
+        logging.warning(f"Gave up on the variants of {failed} upload(s) that were never rendered.")
+    return failed
+
+
+def register_upload(connect, digest: str, extension: str, filename: str, size: int, is_new: bool):
+    """Records an upload and queues its variants in the background process pool.
+
+    Args:
+        connect: A callable returning a connection to the admin database.
+        digest (str): The SHA-256 digest returned by `save_upload`.
+        extension (str): The file extension.
+        filename (str): The name the file was uploaded with.
+        size (int): The file size in bytes.
+        is_new (bool): Whether the content was new to the store.
+
+    """
+    status = "pending" if Image is not None else "skipped"
+    with connect() as conn:
+        ensure_schema(conn)
+        conn.execute(
+            'INSERT OR IGNORE INTO uploads (digest, extension, original_name, size, status) VALUES (?, ?, ?, ?, ?)',
+            (digest, extension, filename, size, status),
+        )
+        conn.commit()
+    if Image is None:
+        logging.warning("Pillow is not installed; storing uploaded images without variants.")
+        return
+    if not is_new:
+        return
+
+    def record_result(future):
+        try:
+            future.result()
+            result = "ready"
+        except Exception as e:
+            logging.error(f"Failed to render variants of {digest}{extension}: {str(e)}")
+            result = "failed"
+        with connect() as conn:
+            conn.execute('UPDATE uploads SET status = ? WHERE digest = ?', (result, digest))
+            conn.commit()
+
+    try:
+        future = _submit_render(_store_path(digest, extension), digest)
+    except Exception as e:
+        logging.error(f"Failed to queue variants of {digest}{extension}: {str(e)}")
+        with connect() as conn:
+            conn.execute("UPDATE uploads SET status = 'failed' WHERE digest = ?", (digest,))
+            conn.commit()
+        return
+    future.add_done_callback(record_result)
+
+
+def asset_url(digest: str, extension: str) -> str:
+    """Returns the URL an uploaded image is served at once committed to a site."""
+    return f"{SITE_ASSET_URL}/{digest}{extension}"
+
+
+def referenced_assets(connect, text: str) -> Dict[str, git_objects.FileBlob]:
+    """Finds uploaded images referenced in a post and returns them as commit changes.
+
+    Variants still being rendered are waited for (up to VARIANT_WAIT_SECONDS),
+    so the post and all of its images land in one commit. Renders pending for
+    longer than RENDER_TIMEOUT_SECONDS are marked failed and not waited for.
+    This blocks; call it through `run_in_threadpool`.
+
+    Args:
+        connect: A callable returning a connection to the admin database.
+        text (str): The full post, front matter included.
+
+    Returns:
+        Dict[str, git_objects.FileBlob]: Repository paths mapped to files in the upload store.
+
+    """
+    digests = {match.group(1) for match in _ASSET_URL_PATTERN.finditer(text)}
+    if not digests:
+        return {}
+
+    deadline = time.monotonic() + VARIANT_WAIT_SECONDS
+    placeholders = ", ".join("?" * len(digests))
+    while True:
+        with connect() as conn:
+            ensure_schema(conn)
+            rows = conn.execute(
+                f"SELECT digest, extension, status, created_at < datetime('now', ?) FROM uploads "
+                f"WHERE digest IN ({placeholders})",
+                (f"-{RENDER_TIMEOUT_SECONDS} seconds", *digests),
+            ).fetchall()
+            stale = [row[0] for row in rows if row[2] == "pending" and row[3]]
+            if stale:
+                conn.execute(
+                    f"UPDATE uploads SET status = 'failed' WHERE status = 'pending' "
+                    f"AND digest IN ({', '.join('?' * len(stale))})",
+                    stale,
+                )
+                conn.commit()
+        rows = [(d, e, "failed" if d in stale else s) for d, e, s, _ in rows]
+        if all(row[2] != "pending" for row in rows) or time.monotonic() > deadline:
+            break
+        time.sleep(0.5)
+
+    changes = {}
+    for digest, extension, status in rows:
+        if status in ("pending", "failed"):
+            logging.warning(f"Variants of {digest}{extension} are {status}; committing what is stored.")
+        directory = os.path.join(UPLOAD_DIR, digest[:2])
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            logging.error(f"{digest}{extension} is referenced but missing from {UPLOAD_DIR}.")
+            continue
+        for name in names:
+            if name.startswith(digest) and not name.endswith(".part"):
+                changes[f"{SITE_ASSET_DIR}/{name}"] = git_objects.FileBlob(os.path.join(directory, name))
+    return changes
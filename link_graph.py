@@ -0,0 +1,161 @@
+import logging
+import os
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Set, Tuple
+
+# Internal links, e.g. [text](@/blog/post.md#part), also inside shortcode arguments
+_INTERNAL_LINK = re.compile(r'@/([^\s)"\'#?]+\.md)')
+# Shortcodes that take a content path, e.g. {{ post_card(path="blog/post.md") }}
+_SHORTCODE_PATH = re.compile(r'\{[{%][^}]*?\bpath\s*=\s*["\']/?([^"\']+\.md)["\']')
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the link graph tables if they do not exist yet."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS post_links (
+            site TEXT NOT NULL,
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            PRIMARY KEY (site, source, target)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_post_links_target ON post_links (site, target)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS link_graph_sites (
+            site TEXT PRIMARY KEY
+        )
+    ''')
+
+
+def extract_links(text: str) -> Set[str]:
+    """Returns the repository paths of all posts a post links to, e.g. {"content/blog/post.md"}."""
+    targets = {m.group(1) for m in _INTERNAL_LINK.finditer(text)}
+    targets.update(m.group(1) for m in _SHORTCODE_PATH.finditer(text))
+    return {"content/" + os.path.normpath(t).replace(os.sep, "/") for t in targets}
+
+
+def _is_built(conn: sqlite3.Connection, site: str) -> bool:
+    return conn.execute('SELECT 1 FROM link_graph_sites WHERE site = ?', (site,)).fetchone() is not None
+
+
+def rebuild(conn: sqlite3.Connection, site: str, repo_path: str) -> int:
+    """Rebuilds the link graph of a site from its content directory.
+
+    Returns:
+        int: The number of links found.
+
+    """
+    rows = []
+    for root, _, files in os.walk(os.path.join(repo_path, "content")):
+        for name in files:
+            if not name.endswith(".md"):
+                continue
+            file_path = os.path.join(root, name)
+            source = os.path.relpath(file_path, repo_path).replace(os.sep, "/")
+            try:
+                with open(file_path, encoding='utf-8') as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                logging.warning(f"Skipping {source} in the link graph: {str(e)}")
+                continue
+            rows.extend((source, target) for target in extract_links(text))
+    return replace_links(conn, site, rows)
+
+
+def replace_links(conn: sqlite3.Connection, site: str, links: Iterable[Tuple[str, str]]) -> int:
+    """Replaces the whole link graph of a site with (source, target) pairs collected by the caller.
+
+    Returns:
+        int: The number of links stored.
+
+    """
+    ensure_schema(conn)
+    conn.execute('DELETE FROM post_links WHERE site = ?', (site,))
+    rows = [(site, source, target) for source, target in links]
+    conn.executemany('INSERT OR IGNORE INTO post_links (site, source, target) VALUES (?, ?, ?)', rows)
+    conn.execute('INSERT OR IGNORE INTO link_graph_sites (site) VALUES (?)', (site,))
+    conn.commit()
+    logging.info(f"Built the link graph of {site}: {len(rows)} links")
+    return len(rows)
+
+
+def ensure_built(conn: sqlite3.Connection, site: str, repo_path: str):
+    """Builds the link graph of a site on first use."""
+    ensure_schema(conn)
+    if not _is_built(conn, site):
+        rebuild(conn, site, repo_path)
+
+
+def update_post(conn: sqlite3.Connection, site: str, path: str, text: str):
+    """Replaces the outgoing links of one saved post.
+
+    Only the rows of `path` are touched. Until the graph of the site has
+    been built, this does nothing; the first build picks the post up.
+    """
+    ensure_schema(conn)
+    if not _is_built(conn, site):
+        return
+    conn.execute('DELETE FROM post_links WHERE site = ? AND source = ?', (site, path))
+    conn.executemany(
+        'INSERT OR IGNORE INTO post_links (site, source, target) VALUES (?, ?, ?)',
+        [(site, path, target) for target in extract_links(text)],
+    )
+    conn.commit()
+
+
+def remove_post(conn: sqlite3.Connection, site: str, path: str):
+    """Drops the outgoing links of a deleted post; links to it stay and show up as broken."""
+    ensure_schema(conn)
+    conn.execute('DELETE FROM post_links WHERE site = ? AND source = ?', (site, path))
+    conn.commit()
+
+
+def apply_changes(conn: sqlite3.Connection, site: str, repo_path: str, paths: Optional[Iterable[str]]):
+    """Brings the link graph up to date with files changed outside the admin.
+
+    Args:
+        conn (sqlite3.Connection): The admin database.
+        site (str): The site slug.
+        repo_path (str): The site repository.
+        paths (Optional[Iterable[str]]): Changed repository-relative paths, or None to rebuild.
+
+    """
+    ensure_schema(conn)
+    if not _is_built(conn, site):
+        return
+    if paths is None:
+        rebuild(conn, site, repo_path)
+        return
+    for path in paths:
+        if not (path.startswith("content/") and path.endswith(".md")):
+            continue
+        try:
+            with open(os.path.join(repo_path, path), encoding='utf-8') as f:
+                update_post(conn, site, path, f.read())
+        except FileNotFoundError:
+            remove_post(conn, site, path)
+        except (OSError, UnicodeDecodeError) as e:
+            logging.warning(f"Skipping {path} in the link graph: {str(e)}")
+
+
+def backlinks(conn: sqlite3.Connection, site: str, path: str) -> List[str]:
+    """Returns the posts that link to `path`."""
+    rows = conn.execute(
+        'SELECT source FROM post_links WHERE site = ? AND target = ? AND source != target ORDER BY source',
+        (site, path),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def broken_links(conn: sqlite3.Connection, site: str, repo_path: str) -> List[Tuple[str, str]]:
+    """Returns (source, target) pairs whose target post does not exist."""
+    targets = [row[0] for row in conn.execute('SELECT DISTINCT target FROM post_links WHERE site = ?', (site,))]
+    missing = [t for t in targets if not os.path.isfile(os.path.join(repo_path, t))]
+    if not missing:
+        return []
+    placeholders = ", ".join("?" * len(missing))
+    return [tuple(row) for row in conn.execute(
+        f'SELECT source, target FROM post_links WHERE site = ? AND target IN ({placeholders}) ORDER BY source, target',
+        (site, *missing),
+    )]
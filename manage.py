@@ -0,0 +1,132 @@
+import argparse
+import getpass
+import json
+import os
+import sqlite3
+import sys
+
+from dotenv import load_dotenv
+from passlib.hash import pbkdf2_sha256
+
+import site_check
+import sites
+from admin_db import connect
+
+
+def resolve_sites(parser: argparse.ArgumentParser, slug, all_sites: bool):
+    registry = sites.SiteRegistry(connect, os.getenv("GIT_REPO_PATH"))
+    if all_sites:
+        return [registry.get(s["slug"]) for s in registry.list()]
+    slug = slug or registry.default_slug()
+    site = registry.get(slug) if slug else None
+    if site is None:
+        parser.error(f"Unknown site: {slug}")
+    return [site]
+
+
+def check(parser, args) -> int:
+    reports = []
+    for site in resolve_sites(parser, args.site, args.all_sites):
+        report = site_check.check_site(site, connect, workers=args.workers, rebuild_indexes=not args.no_rebuild)
+        site.close()
+        summary = report["summary"]
+        print(f"{site.slug}: checked {report['files']} files in {report['duration_seconds']}s, "
+              f"{summary['errors']} errors, {summary['warnings']} warnings", file=sys.stderr)
+        reports.append(report)
+
+    rules = {rule: {"severity": severity, "description": description}
+             for rule, (severity, description) in site_check.RULES.items()}
+    output = json.dumps({"rules": rules, "sites": reports}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if any(r["summary"]["errors"] for r in reports) else 0
+
+
+def show_admin(parser, args) -> int:
+    with connect() as conn:
+        admin_user = conn.execute("SELECT userid, username, password FROM users WHERE username = 'admin'").fetchone()
+    if not admin_user:
+        print("Admin user not found in the database.")
+        return 1
+    userid, username, password = admin_user
+    print("Admin user found:")
+    print(f"User ID: {userid}")
+    print(f"Username: {username}")
+    print(f"Password hash: {password}")
+    return 0
+
+
+def create_admin(parser, args) -> int:
+    password = args.password
+    if password is None:
+        password = getpass.getpass("Password for admin: ")
+        if getpass.getpass("Repeat the password: ") != password:
+            parser.error("The passwords do not match.")
+    if not password or password == "admin":
+        # The app refuses to start with the admin/admin login
+        parser.error("Choose a password other than an empty one or \"admin\".")
+    with connect() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                userid INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password TEXT NOT NULL
+            )
+        ''')
+        try:
+            conn.execute('INSERT INTO users (username, password) VALUES (?, ?)',
+                         ("admin", pbkdf2_sha256.hash(password)))
+            conn.commit()
+            print("Default admin user created.")
+        except sqlite3.IntegrityError:
+            print("Admin user already exists.")
+    return 0
+
+
+def empty_db(parser, args) -> int:
+    if not args.yes:
+        parser.error("This deletes all users, sites and indexes; pass --yes to confirm.")
+    with connect() as conn:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        for table_name in tables:
+            if table_name != "sqlite_sequence":  # Internal table used for auto-increment
+                conn.execute(f'DELETE FROM "{table_name}"')
+                print(f"Emptied table: {table_name}")
+        conn.commit()
+    print("Database has been emptied.")
+    return 0
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Maintenance tasks for zola-admin.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = commands.add_parser(
+        "check", help="Check all content files, rebuild derived indexes and print a JSON report",
+        description="Checks the front matter of every content file in parallel (TOML errors, missing title "
+                    "or date, bad dates, duplicate slugs, unknown and orphaned categories) and rebuilds the "
+                    "link graph, post statistics and history index. Exits with 1 if any errors were found.")
+    check_parser.add_argument("--site", help="Slug of the site to check (defaults to the GIT_REPO_PATH site)")
+    check_parser.add_argument("--all-sites", action="store_true", help="Check every registered site")
+    check_parser.add_argument("--workers", type=int, help="Number of worker processes (defaults to the CPU count)")
+    check_parser.add_argument("--no-rebuild", action="store_true", help="Only check, leave the indexes alone")
+    check_parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    check_parser.set_defaults(handler=check)
+
+    commands.add_parser("show-admin", help="Show the admin user").set_defaults(handler=show_admin)
+
+    create_parser = commands.add_parser("create-admin", help="Create the users table and the admin user")
+    create_parser.add_argument("--password", help="Password of the admin user (prompted for if omitted)")
+    create_parser.set_defaults(handler=create_admin)
+
+    empty_parser = commands.add_parser("empty-db", help="Delete all rows from all tables")
+    empty_parser.add_argument("--yes", action="store_true", help="Confirm deleting everything")
+    empty_parser.set_defaults(handler=empty_db)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(parser, args))
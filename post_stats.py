@@ -0,0 +1,325 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import toml
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11; the toml package is less strict than Zola
+    tomllib = None
+
+import concurrency
+import coordination
+import durable_io
+import git_objects
+import sites
+
+WORDS_PER_MINUTE = 200
+
+_FENCE = re.compile(r"^(```|~~~).*?^\1[^\n]*$", re.MULTILINE | re.DOTALL)
+_HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+_MARKUP = re.compile(r"\{\{.*?\}\}|\{%.*?%\}|<[^>]+>|\]\([^)]*\)", re.DOTALL)
+
+
+def split_post(text: str) -> Tuple[str, str]:
+    """Splits a post into its raw front matter and its body, the way parse_front_matter does."""
+    parts = text.split('+++', 2)
+    if len(parts) < 3:
+        return "", text
+    return parts[1], parts[2]
+
+
+def load_front_matter(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Parses the TOML front matter of a post, as the editor and `manage.py check` read it.
+
+    Returns:
+        Tuple[Optional[Dict[str, Any]], str]: The front matter, or None if the
+            post has no +++ block, and the body.
+
+    Raises:
+        toml.TomlDecodeError: If the front matter is not valid TOML.
+
+    """
+    parts = text.split('+++', 2)
+    if len(parts) < 3:
+        return None, text
+    return toml.loads(parts[1].strip()), parts[2]
+
+
+def compute_stats(body: str) -> Dict[str, Any]:
+    """Computes the word count, reading time and heading outline of a post body.
+
+    Code blocks, shortcodes, HTML tags and link targets are not counted as words.
+
+    Args:
+        body (str): The markdown body, without front matter.
+
+    Returns:
+        Dict[str, Any]: "word_count", "reading_time" in whole minutes (at least 1),
+            and "outline", a list of {"level", "text"} dictionaries.
+
+    """
+    prose = _FENCE.sub(" ", body)
+    outline = [{"level": len(m.group(1)), "text": m.group(2)} for m in _HEADING.finditer(prose)]
+    word_count = len(_MARKUP.sub(" ", prose).replace("#", " ").split())
+    return {
+        "word_count": word_count,
+        "reading_time": max(1, math.ceil(word_count / WORDS_PER_MINUTE)),
+        "outline": outline,
+    }
+
+
+def format_reading_time(minutes: int) -> str:
+    """Formats a reading time the way it is written to front matter."""
+    return f"{minutes} min"
+
+
+def _statements(front_matter: str) -> List[Tuple[int, bool]]:
+    """Returns where the top-level TOML statements of a front matter start, up to the first table.
+
+    Each entry is the offset of the first character of a line that is not
+    inside an array, inline table or multi-line string, and whether that line
+    is a [table] header. A nested array element such as `["a", "b"]` on a
+    line of its own is therefore not mistaken for a header.
+    """
+    starts: List[Tuple[int, bool]] = []
+    depth = 0
+    quote = None  # Delimiter of the string being read
+    line_start = True
+    i, n = 0, len(front_matter)
+    while i < n:
+        c = front_matter[i]
+        if quote is not None:
+            if c == "\\" and quote[0] == '"':
+                i += 2
+            elif front_matter.startswith(quote, i):
+                i += len(quote)
+                quote = None
+            elif c == "\n" and len(quote) == 1:
+                quote = None  # Unterminated; TOML validation reports it
+            else:
+                i += 1
+            continue
+        if c == "\n":
+            line_start = True
+        elif c in " \t\r":
+            pass
+        elif c == "#":
+            end = front_matter.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        else:
+            if line_start and depth == 0:
+                starts.append((i, c == "["))
+                if c == "[":
+                    break
+            line_start = False
+            if c in "\"'":
+                quote = c * 3 if front_matter.startswith(c * 3, i) else c
+                i += len(quote)
+                continue
+            if c in "[{":
+                depth += 1
+            elif c in "]}":
+                depth = max(depth - 1, 0)
+        i += 1
+    return starts
+
+
+def _loads_toml(text: str) -> Dict[str, Any]:
+    if tomllib is not None:
+        return tomllib.loads(text)
+    return toml.loads(text)
+
+
+def set_front_matter_key(text: str, key: str, value: str) -> str:
+    """Returns a post with the top-level front matter `key` set to the TOML literal `value`.
+
+    Keys inside tables such as [extra] are left alone; a missing key is added
+    at the top, since top-level keys must come before any [table].
+
+    Raises:
+        ValueError: If the front matter would not be valid TOML afterwards, or
+            would not have `key` set to `value`.
+
+    """
+    front_matter, body = split_post(text)
+    if not front_matter:
+        return text
+    starts = _statements(front_matter)
+    line = f"{key} = {value}"
+    pattern = re.compile(rf"{re.escape(key)}[ \t]*=[^\n]*")
+    existing = next((pattern.match(front_matter, offset) for offset, is_header in starts
+                     if not is_header and pattern.match(front_matter, offset)), None)
+    if existing:
+        front_matter = front_matter[:existing.start()] + line + front_matter[existing.end():]
+    else:
+        front_matter = f"\n{line}" + front_matter
+
+    # Zola refuses to build a site with broken front matter, so never hand one out
+    try:
+        parsed = _loads_toml(front_matter.strip())
+        wanted = _loads_toml(line)[key]
+    except ValueError as e:
+        raise ValueError(f"Setting {key} would leave invalid front matter: {e}")
+    if parsed.get(key) != wanted:
+        raise ValueError(f"Setting {key} did not take effect in the front matter")
+    return f"{text[:text.index('+++')]}+++{front_matter}+++{body}"
+
+
+def set_reading_time(text: str, minutes: int) -> str:
+    """Returns a post with the reading_time front matter key set to `minutes`."""
+    return set_front_matter_key(text, "reading_time", f'"{format_reading_time(minutes)}"')
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the post statistics table if it does not exist yet."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS post_stats (
+            site TEXT NOT NULL,
+            path TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            word_count INTEGER NOT NULL,
+            reading_time INTEGER NOT NULL,
+            outline TEXT NOT NULL,
+            PRIMARY KEY (site, path)
+        )
+    ''')
+
+
+def record(conn: sqlite3.Connection, site: str, path: str, content_hash: str, stats: Dict[str, Any]):
+    """Stores the statistics of one post, keyed by the blob id of its content."""
+    conn.execute(
+        'INSERT OR REPLACE INTO post_stats (site, path, content_hash, word_count, reading_time, outline) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (site, path, content_hash, stats["word_count"], stats["reading_time"], json.dumps(stats["outline"])),
+    )
+
+
+def record_post(connect, site: str, path: str, text: str):
+    """Computes and stores the statistics of a post that was just saved."""
+    stats = compute_stats(split_post(text)[1])
+    with connect() as conn:
+        ensure_schema(conn)
+        record(conn, site, path, concurrency.blob_id(text.encode()), stats)
+        conn.commit()
+
+
+def _analyse(job: Tuple[str, str, Optional[Tuple[str, int]]]
+             ) -> Optional[Tuple[str, str, Dict[str, Any], Optional[bytes]]]:
+    """Backfill worker: returns (path, blob id, stats, new content or None), or None if unchanged.
+
+    A post is unchanged if its statistics are cached for its content and its
+    front matter already has the cached reading time; cached statistics
+    alone do not mean the reading time was written, e.g. after a check.
+    """
+    file_path, rel_path, cached = job
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    content_hash = concurrency.blob_id(data)
+    text = data.decode('utf-8')
+    if cached and content_hash == cached[0] and set_reading_time(text, cached[1]) == text:
+        return None
+    stats = compute_stats(split_post(text)[1])
+    updated = set_reading_time(text, stats["reading_time"]).encode('utf-8')
+    return rel_path, content_hash, stats, (updated if updated != data else None)
+
+
+def _analyse_safely(job):
+    try:
+        return _analyse(job)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to analyse {job[1]}: {str(e)}")
+        return "failed"
+
+
+def backfill(site: sites.Site, connect, workers: Optional[int] = None, push: bool = True) -> Dict[str, int]:
+    """Computes statistics for every post of a site and writes reading times in one commit.
+
+    Posts are analysed in parallel processes. Posts whose content hash
+    matches the cached statistics and whose reading time is already written
+    are skipped. A post that is saved from the
+    editor while the backfill runs is left alone and picked up next time.
+
+    Args:
+        site (sites.Site): The site to process.
+        connect: A callable returning a connection to the admin database.
+        workers (Optional[int]): Number of worker processes, defaulting to the CPU count.
+        push (bool): Whether to push the commit.
+
+    Returns:
+        Dict[str, int]: Counts of "scanned", "skipped", "updated" and "failed" posts.
+
+    """
+    content_dir = os.path.join(site.repo_path, "content")
+    with connect() as conn:
+        ensure_schema(conn)
+        cached = {path: (content_hash, reading_time) for path, content_hash, reading_time in conn.execute(
+            'SELECT path, content_hash, reading_time FROM post_stats WHERE site = ?', (site.slug,))}
+
+    jobs = []
+    for root, _, files in os.walk(content_dir):
+        for name in files:
+            if name.endswith(".md"):
+                file_path = os.path.join(root, name)
+                rel_path = os.path.relpath(file_path, site.repo_path).replace(os.sep, "/")
+                jobs.append((file_path, rel_path, cached.get(rel_path)))
+
+    summary = {"scanned": len(jobs), "skipped": 0, "updated": 0, "failed": 0}
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_analyse_safely, jobs, chunksize=256):
+            if result is None:
+                summary["skipped"] += 1
+            elif result == "failed":
+                summary["failed"] += 1
+            else:
+                results.append(result)
+
+    changes: Dict[str, Optional[bytes]] = {}
+    expected: Dict[str, Optional[str]] = {}
+    rows = []
+    for rel_path, content_hash, stats, updated in results:
+        if updated is not None:
+            # Leave posts alone that were saved after they were read
+            if concurrency.file_blob_id(os.path.join(site.repo_path, rel_path)) != content_hash:
+                continue
+            changes[rel_path] = updated
+            expected[rel_path] = content_hash
+            content_hash = concurrency.blob_id(updated)
+        rows.append((rel_path, content_hash, stats))
+
+    # The working tree is only touched once the commit stands, so a failed
+    # commit leaves no uncommitted changes behind
+    while changes:
+        try:
+            git_objects.commit_changes(site.repo(), changes, f"Update reading times of {len(changes)} posts",
+                                       expected=expected)
+        except git_objects.StaleBlobError as e:
+            # Committed from the editor meanwhile; their version stands
+            for path in e.paths:
+                changes.pop(path)
+            rows = [row for row in rows if row[0] not in e.paths]
+            continue
+        for rel_path, updated in changes.items():
+            file_path = os.path.join(site.repo_path, rel_path)
+            with coordination.path_lock(site.repo_path, rel_path):
+                if concurrency.file_blob_id(file_path) == expected[rel_path]:
+                    # Not flushed per file, which would make large backfills crawl; the commit has the content
+                    durable_io.write_file(file_path, updated, durable=False)
+        summary["updated"] = len(changes)
+        if push:
+            site.push()
+        break
+
+    with connect() as conn:
+        for rel_path, content_hash, stats in rows:
+            record(conn, site.slug, rel_path, content_hash, stats)
+        conn.commit()
+    return summary
@@ -0,0 +1,326 @@
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import concurrency
+import coordination
+import durable_io
+import git_objects
+import post_stats
+import sites
+
+# action -> value written to the draft key of the front matter
+ACTIONS = {"publish": "false", "unpublish": "true"}
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the scheduled changes table if it does not exist yet.
+
+    Due times are UTC ISO timestamps, which sort as text. The partial indexes
+    only hold pending changes, so finding what is due stays a short index
+    range scan however many changes were applied in the past.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site TEXT NOT NULL,
+            path TEXT NOT NULL,
+            action TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            created_by TEXT,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            applied_at TEXT,
+            commit_sha TEXT,
+            error TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_scheduled_changes_due ON scheduled_changes (due_at) "
+                 "WHERE status = 'pending'")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_scheduled_changes_site_due ON scheduled_changes (site, due_at) "
+                 "WHERE status = 'pending'")
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_scheduled_changes_site ON scheduled_changes (site, id)')
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_scheduled_changes_applying ON scheduled_changes (site) "
+                 "WHERE status = 'applying'")
+
+
+def to_utc(moment: datetime) -> str:
+    """Formats a datetime the way due times are stored; naive datetimes count as UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def schedule(conn: sqlite3.Connection, site: str, path: str, action: str, due_at: datetime,
+             created_by: Optional[str] = None) -> int:
+    """Stores a change to apply at `due_at` and returns its id.
+
+    Raises:
+        ValueError: If the action is unknown.
+
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action: {action}")
+    ensure_schema(conn)
+    change_id = conn.execute(
+        'INSERT INTO scheduled_changes (site, path, action, due_at, created_by, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+        (site, path, action, to_utc(due_at), created_by, to_utc(datetime.now(timezone.utc))),
+    ).lastrowid
+    conn.commit()
+    return change_id
+
+
+def cancel(conn: sqlite3.Connection, site: str, change_id: int) -> bool:
+    """Cancels a pending change; returns False if it was already applied or cancelled."""
+    ensure_schema(conn)
+    cancelled = conn.execute(
+        "UPDATE scheduled_changes SET status = 'cancelled' WHERE id = ? AND site = ? AND status = 'pending'",
+        (change_id, site),
+    ).rowcount
+    conn.commit()
+    return bool(cancelled)
+
+
+def changes(conn: sqlite3.Connection, site: str, limit: int = 200) -> List[sqlite3.Row]:
+    """Returns the pending changes of a site in due order, then the most recent others."""
+    ensure_schema(conn)
+    pending = conn.execute(
+        "SELECT * FROM scheduled_changes WHERE site = ? AND status = 'pending' ORDER BY due_at, id",
+        (site,),
+    ).fetchall()
+    done = conn.execute(
+        "SELECT * FROM scheduled_changes WHERE site = ? AND status != 'pending' ORDER BY id DESC LIMIT ?",
+        (site, limit),
+    ).fetchall()
+    return pending + done
+
+
+def next_due(conn: sqlite3.Connection) -> Optional[datetime]:
+    """Returns when the next pending change of any site is due, or None.
+
+    Changes left 'applying' by an interrupted tick count as due, so they are
+    settled by the next tick.
+    """
+    ensure_schema(conn)
+    row = conn.execute("SELECT MIN(due_at) FROM scheduled_changes WHERE status IN ('pending', 'applying')").fetchone()
+    return datetime.fromisoformat(row[0]) if row[0] else None
+
+
+def due_sites(conn: sqlite3.Connection, now: Optional[datetime] = None) -> List[str]:
+    """Returns the slugs of sites with changes due at `now` or left 'applying' by an interrupted tick."""
+    ensure_schema(conn)
+    rows = conn.execute(
+        "SELECT site FROM scheduled_changes WHERE status = 'pending' AND due_at <= ? "
+        "UNION SELECT site FROM scheduled_changes WHERE status = 'applying'",
+        (to_utc(now or datetime.now(timezone.utc)),),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+# Trailer listing the ids of the changes a scheduler commit applies
+_TRAILER = "Scheduled-Changes:"
+# How many commits of a post to search when reconciling an interrupted tick
+_RECONCILE_DEPTH = 50
+
+
+def _head_blob(repo, path: str) -> Optional[str]:
+    try:
+        return repo.head.commit.tree[path].hexsha
+    except KeyError:
+        return None
+
+
+def _committed_ids(repo, path: str) -> Dict[int, str]:
+    """Maps the ids of scheduled changes found in recent commits of `path` to their commit."""
+    found: Dict[int, str] = {}
+    output = repo.git.log(f"-n{_RECONCILE_DEPTH}", "--format=%H%x1f%B%x1e", "--", path)
+    for record in output.split("\x1e"):
+        sha, _, message = record.strip().partition("\x1f")
+        for line in message.splitlines():
+            if line.startswith(_TRAILER):
+                found.update((int(i), sha) for i in line[len(_TRAILER):].split() if i.isdigit())
+    return found
+
+
+def _reconcile(site: sites.Site, connect, repo):
+    """Settles changes left 'applying' by a tick that was interrupted.
+
+    A change whose id is in a commit of its post was applied, even if the
+    post was changed again since; anything else never reached a commit and
+    is pending again.
+    """
+    with connect() as conn:
+        rows = conn.execute("SELECT id, path FROM scheduled_changes WHERE site = ? AND status = 'applying'",
+                            (site.slug,)).fetchall()
+        if not rows:
+            return
+        commits: Dict[str, Dict[int, str]] = {}
+        for change_id, path in rows:
+            if path not in commits:
+                commits[path] = _committed_ids(repo, path)
+            commit_sha = commits[path].get(change_id)
+            if commit_sha:
+                conn.execute("UPDATE scheduled_changes SET status = 'applied', applied_at = ?, commit_sha = ? "
+                             "WHERE id = ?", (to_utc(datetime.now(timezone.utc)), commit_sha, change_id))
+            else:
+                conn.execute("UPDATE scheduled_changes SET status = 'pending' WHERE id = ?", (change_id,))
+            logging.info(f"Scheduled change {change_id} of {site.slug} was "
+                         + (f"applied in {commit_sha[:7]}." if commit_sha else "not committed; retrying."))
+        conn.commit()
+
+
+def _set_status(connect, ids: List[int], status: str, where_status: str):
+    if not ids:
+        return
+    with connect() as conn:
+        conn.execute(
+            f"UPDATE scheduled_changes SET status = ? WHERE status = ? AND id IN ({', '.join('?' * len(ids))})",
+            (status, where_status, *ids),
+        )
+        conn.commit()
+
+
+def apply_due(site: sites.Site, connect, now: Optional[datetime] = None,
+              push_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Applies all changes of a site that are due, in one commit and one push.
+
+    Runs under a cross-process lock per site, so several workers ticking at
+    once apply each change once. Changes are marked 'applying' and their
+    ids are written into the commit message before committing; changes a
+    crash left 'applying' are settled against the history of their post
+    instead of being run again. Setting draft is idempotent, and a post that
+    is already in the wanted state but not committed (e.g. after a crash
+    between writing and committing) is committed as it is. Posts committed
+    from elsewhere while the changes were prepared are left for the next
+    tick.
+
+    Args:
+        site (sites.Site): The site whose due changes to apply.
+        connect: A callable returning a connection to the admin database.
+        now (Optional[datetime]): The time to compare due times against, defaulting to now.
+        push_timeout (Optional[float]): Seconds to wait for the push; on timeout
+            the commit is pushed with the next push.
+
+    Returns:
+        List[Dict[str, Any]]: One entry per handled change with "id", "path",
+            "action", "status", "commit_sha", "before_blob" and "after_blob".
+
+    """
+    with coordination.repo_lock(site.repo_path, "scheduler"):
+        repo = site.repo()
+        with connect() as conn:
+            ensure_schema(conn)
+        _reconcile(site, connect, repo)
+        with connect() as conn:
+            due = conn.execute(
+                "SELECT id, path, action FROM scheduled_changes "
+                "WHERE status = 'pending' AND due_at <= ? AND site = ? ORDER BY due_at, id",
+                (to_utc(now or datetime.now(timezone.utc)), site.slug),
+            ).fetchall()
+        if not due:
+            return []
+
+        by_path: Dict[str, List] = {}
+        for row in due:
+            by_path.setdefault(row[1], []).append(row)
+
+        file_changes: Dict[str, bytes] = {}
+        expected: Dict[str, Optional[str]] = {}
+        # The action that decides the state of each committed post
+        final_action: Dict[str, str] = {}
+        results: List[Dict[str, Any]] = []
+        for path, rows in by_path.items():
+            file_path = os.path.join(site.repo_path, path)
+            with site.path_locks.hold(path):
+                try:
+                    with open(file_path, 'rb') as f:
+                        data = f.read()
+                    text = data.decode('utf-8')
+                    if not post_stats.split_post(text)[0]:
+                        raise ValueError("The post has no front matter")
+                    # Changes to one post that came due together apply in order; the last one wins
+                    for row in rows:
+                        text = post_stats.set_front_matter_key(text, "draft", ACTIONS[row[2]])
+                    error = None
+                except FileNotFoundError:
+                    error = "The post no longer exists"
+                except UnicodeDecodeError:
+                    error = "The post is not UTF-8"
+                except ValueError as e:
+                    # Includes front matter that would not parse afterwards; the post is left as it is
+                    error = str(e)
+                if error:
+                    results += [{"id": r[0], "path": path, "action": r[2], "status": "failed", "error": error}
+                                for r in rows]
+                    continue
+                updated = text.encode('utf-8')
+                head_blob = _head_blob(repo, path)
+                if updated != data:
+                    durable_io.write_file(file_path, updated)
+                if concurrency.blob_id(updated) != head_blob:
+                    file_changes[path] = updated
+                    expected[path] = head_blob
+                    final_action[path] = rows[-1][2]
+            results += [{"id": r[0], "path": path, "action": r[2], "status": "applied", "before_blob": head_blob,
+                         "after_blob": concurrency.blob_id(updated)} for r in rows]
+
+        commit_sha = None
+        while file_changes:
+            ids = [r["id"] for r in results if r["path"] in file_changes]
+            _set_status(connect, ids, "applying", "pending")
+            published = sum(1 for path in file_changes if final_action[path] == "publish")
+            message = (f"Apply {len(file_changes)} scheduled change(s): {published} publish, "
+                       f"{len(file_changes) - published} unpublish\n\n"
+                       + "\n".join(sorted(file_changes))
+                       + f"\n\n{_TRAILER} {' '.join(str(i) for i in sorted(ids))}")
+            try:
+                commit_sha = git_objects.commit_changes(repo, file_changes, message, expected=expected)
+            except git_objects.StaleBlobError as e:
+                # Committed from the editor meanwhile; try again next tick on top of that
+                for path in e.paths:
+                    file_changes.pop(path)
+                    logging.info(f"{path} changed while applying scheduled changes; retrying next tick.")
+                _set_status(connect, [r["id"] for r in results if r["path"] in e.paths], "pending", "applying")
+                results = [r for r in results if r["path"] not in e.paths]
+                continue
+            except Exception:
+                # Nothing was committed; run these again next tick
+                _set_status(connect, ids, "pending", "applying")
+                raise
+            break
+
+        applied_at = to_utc(datetime.now(timezone.utc))
+        with connect() as conn:
+            for result in results:
+                if result["status"] == "applied":
+                    result["commit_sha"] = commit_sha if result["path"] in file_changes else None
+                    conn.execute(
+                        "UPDATE scheduled_changes SET status = 'applied', applied_at = ?, commit_sha = ? "
+                        "WHERE id = ? AND status IN ('pending', 'applying')",
+                        (applied_at, result["commit_sha"], result["id"]),
+                    )
+                else:
+                    result["commit_sha"] = None
+                    conn.execute(
+                        "UPDATE scheduled_changes SET status = 'failed', applied_at = ?, error = ? "
+                        "WHERE id = ? AND status = 'pending'",
+                        (applied_at, result["error"], result["id"]),
+                    )
+            conn.commit()
+        for path in file_changes:
+            post_stats.record_post(connect, site.slug, path, file_changes[path].decode('utf-8'))
+
+    applied = [r for r in results if r["status"] == "applied"]
+    if applied:
+        logging.info(f"Applied {len(applied)} scheduled change(s) to {site.slug}"
+                     + (f" in {commit_sha[:7]}" if commit_sha else ""))
+        # Also without a new commit: it may have been made before a restart and not pushed yet
+        try:
+            site.push(timeout=push_timeout)
+        except sites.GitTimeout as e:
+            logging.error(f"{str(e)}; the scheduled changes go out with the next push.")
+        except Exception as e:
+            logging.error(f"Push of scheduled changes to {site.slug} failed: {str(e)}")
+    return results
@@ -0,0 +1,253 @@
+import logging
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import toml
+from git import GitCommandError
+
+import concurrency
+import history_index
+import link_graph
+import post_stats
+import sites
+
+# rule -> (severity, description)
+RULES = {
+    "unreadable": ("error", "The file cannot be read as UTF-8."),
+    "missing-front-matter": ("error", "The file has no +++ front matter block."),
+    "toml-error": ("error", "The front matter is not valid TOML."),
+    "missing-title": ("error", "The post has no title."),
+    "missing-date": ("error", "The post has no date."),
+    "bad-date": ("error", "A date is not a TOML date or an ISO 8601 string."),
+    "duplicate-slug": ("error", "Two posts would be published at the same URL."),
+    "unknown-category": ("warning", "A post names a category that has no directory under content/blog."),
+    "orphaned-category": ("warning", "A category directory under content/blog holds no posts."),
+}
+
+_SLUG_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+
+def slugify(text: str) -> str:
+    """Approximates the slugs Zola generates: ASCII, lower case, words joined by dashes."""
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _SLUG_SEPARATORS.sub("-", ascii_text.lower()).strip("-")
+
+
+def _valid_date(value: Any) -> bool:
+    if isinstance(value, (date, datetime)):
+        return True
+    if not isinstance(value, str):
+        return False
+    try:
+        if len(value) == 10:
+            date.fromisoformat(value)
+        else:
+            datetime.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _url_key(content_path: str, front_matter: Dict[str, Any]) -> str:
+    """Returns the URL path a page is published at, relative to the site root."""
+    if isinstance(front_matter.get("path"), str):
+        return front_matter["path"].strip("/")
+    directory, name = os.path.split(os.path.splitext(content_path)[0])
+    if name == "index":
+        # Page bundle: the directory names the page
+        directory, name = os.path.split(directory)
+    slug = front_matter.get("slug") if isinstance(front_matter.get("slug"), str) else name
+    return f"{directory}/{slugify(slug)}".strip("/")
+
+
+def _categories(front_matter: Dict[str, Any]) -> List[str]:
+    values = front_matter.get("categories")
+    taxonomies = front_matter.get("taxonomies")
+    if values is None and isinstance(taxonomies, dict):
+        values = taxonomies.get("categories")
+    if not isinstance(values, list):
+        return []
+    return [v for v in values if isinstance(v, str) and v]
+
+
+def check_file(job: Tuple[str, str, bool]) -> Dict[str, Any]:
+    """Checks one content file; runs in a worker process.
+
+    The front matter is parsed with post_stats.load_front_matter, like the editor does. With
+    `with_indexes`, the statistics and outgoing links of the file are
+    returned as well, so indexes can be rebuilt from the same read.
+
+    Args:
+        job (Tuple[str, str, bool]): The absolute path, the repository-relative
+            path and whether to compute index data.
+
+    Returns:
+        Dict[str, Any]: "path", "issues" as (rule, message) pairs, "url" (None
+            for sections and broken files), "categories", and with index data
+            "blob", "stats" and "links".
+
+    """
+    file_path, rel_path, with_indexes = job
+    result: Dict[str, Any] = {"path": rel_path, "issues": [], "url": None, "categories": []}
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        text = data.decode('utf-8')
+    except (OSError, UnicodeDecodeError) as e:
+        result["issues"].append(("unreadable", str(e)))
+        return result
+
+    if with_indexes:
+        result["blob"] = concurrency.blob_id(data)
+        result["stats"] = post_stats.compute_stats(post_stats.split_post(text)[1])
+        result["links"] = sorted(link_graph.extract_links(text))
+
+    try:
+        front_matter, _ = post_stats.load_front_matter(text)
+    except toml.TomlDecodeError as e:
+        result["issues"].append(("toml-error", str(e)))
+        return result
+    if front_matter is None:
+        result["issues"].append(("missing-front-matter", "Expected front matter between +++ lines"))
+        return result
+
+    result["categories"] = _categories(front_matter)
+    if os.path.basename(rel_path) == "_index.md":
+        return result  # Sections need neither a title nor a date
+
+    if not front_matter.get("title"):
+        result["issues"].append(("missing-title", "title is missing or empty"))
+    if "date" not in front_matter:
+        result["issues"].append(("missing-date", "date is missing"))
+    for key in ("date", "updated"):
+        if key in front_matter and not _valid_date(front_matter[key]):
+            result["issues"].append(("bad-date", f"{key} = {front_matter[key]!r} is not a valid date"))
+    result["url"] = _url_key(os.path.relpath(rel_path, "content"), front_matter)
+    return result
+
+
+def _category_dirs(repo_path: str) -> Tuple[Set[str], Set[str]]:
+    """Returns the category directories under content/blog and their names.
+
+    Page bundles (directories with an index.md) and everything below them are not categories.
+    """
+    blog_dir = os.path.join(repo_path, "content", "blog")
+    directories = set()
+    for root, dirs, files in os.walk(blog_dir):
+        if root != blog_dir:
+            if "index.md" in files:
+                dirs[:] = []
+                continue
+            directories.add(os.path.relpath(root, repo_path).replace(os.sep, "/"))
+    return directories, {os.path.basename(d) for d in directories}
+
+
+def check_site(site: sites.Site, connect=None, workers: Optional[int] = None,
+               rebuild_indexes: bool = True) -> Dict[str, Any]:
+    """Checks every content file of a site in parallel and optionally rebuilds its derived indexes.
+
+    Args:
+        site (sites.Site): The site to check.
+        connect: A callable returning a connection to the admin database;
+            required to rebuild indexes.
+        workers (Optional[int]): Number of worker processes, defaulting to the CPU count.
+        rebuild_indexes (bool): Whether to rebuild the link graph, the post
+            statistics and the history index from this scan.
+
+    Returns:
+        Dict[str, Any]: A JSON-serializable report with a summary, all issues
+            and, if rebuilt, the sizes of the rebuilt indexes.
+
+    """
+    start = time.monotonic()
+    jobs = []
+    for root, _, files in os.walk(os.path.join(site.repo_path, "content")):
+        for name in files:
+            if name.endswith(".md"):
+                file_path = os.path.join(root, name)
+                rel_path = os.path.relpath(file_path, site.repo_path).replace(os.sep, "/")
+                jobs.append((file_path, rel_path, rebuild_indexes))
+
+    issues: List[Dict[str, str]] = []
+    urls: Dict[str, List[str]] = {}
+    used_categories: Dict[str, List[str]] = {}
+    stats_rows, links = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(check_file, jobs, chunksize=256):
+            path = result["path"]
+            issues.extend({"path": path, "rule": rule, "message": message} for rule, message in result["issues"])
+            if result["url"] is not None:
+                urls.setdefault(result["url"], []).append(path)
+            for category in result["categories"]:
+                used_categories.setdefault(category, []).append(path)
+            if "stats" in result:
+                stats_rows.append((path, result["blob"], result["stats"]))
+                links.extend((path, target) for target in result["links"])
+
+    for url, paths in urls.items():
+        if len(paths) > 1:
+            for path in paths:
+                others = ", ".join(p for p in paths if p != path)
+                issues.append({"path": path, "rule": "duplicate-slug", "message": f"/{url}/ is also used by {others}"})
+
+    category_dirs, category_names = _category_dirs(site.repo_path)
+    for category, paths in used_categories.items():
+        if category not in category_names:
+            issues.extend({"path": path, "rule": "unknown-category",
+                           "message": f'"{category}" has no directory under content/blog'} for path in paths)
+    populated = set()
+    for paths in urls.values():
+        for path in paths:
+            directory = os.path.dirname(path)
+            while directory.startswith("content/blog/"):
+                populated.add(directory)
+                directory = os.path.dirname(directory)
+    issues.extend({"path": d, "rule": "orphaned-category", "message": "No posts in this category"}
+                  for d in sorted(category_dirs - populated))
+
+    for issue in issues:
+        issue["severity"] = RULES[issue["rule"]][0]
+    issues.sort(key=lambda i: (i["path"], i["rule"]))
+    by_rule: Dict[str, int] = {}
+    for issue in issues:
+        by_rule[issue["rule"]] = by_rule.get(issue["rule"], 0) + 1
+
+    report: Dict[str, Any] = {
+        "site": site.slug,
+        "repo_path": site.repo_path,
+        "checked_at": datetime.now().isoformat(timespec="seconds"),
+        "files": len(jobs),
+        "workers": workers or os.cpu_count(),
+        "summary": {
+            "errors": sum(1 for i in issues if i["severity"] == "error"),
+            "warnings": sum(1 for i in issues if i["severity"] == "warning"),
+            "by_rule": by_rule,
+        },
+        "issues": issues,
+    }
+    if rebuild_indexes:
+        report["indexes"] = _rebuild_indexes(site, connect, stats_rows, links)
+    report["duration_seconds"] = round(time.monotonic() - start, 2)
+    return report
+
+
+def _rebuild_indexes(site: sites.Site, connect, stats_rows, links) -> Dict[str, Optional[int]]:
+    """Replaces the derived indexes of a site with the data collected by a scan."""
+    with connect() as conn:
+        post_stats.ensure_schema(conn)
+        conn.execute('DELETE FROM post_stats WHERE site = ?', (site.slug,))
+        for path, blob, stats in stats_rows:
+            post_stats.record(conn, site.slug, path, blob, stats)
+        conn.commit()
+        link_count = link_graph.replace_links(conn, site.slug, links)
+        try:
+            commits = history_index.rebuild_index(conn, site.repo(), site.slug)
+        except GitCommandError as e:
+            logging.error(f"Failed to rebuild the history index of {site.slug}: {str(e)}")
+            commits = None
+    return {"post_stats": len(stats_rows), "link_graph": link_count, "history_commits": commits}
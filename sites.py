@@ -0,0 +1,205 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+
+from git import Repo
+
+import concurrency
+import coordination
+
+# Slug of the site configured through GIT_REPO_PATH.
+DEFAULT_SITE = "default"
+
+
+class GitTimeout(Exception):
+    """Raised when a git operation on a site's remote takes longer than allowed."""
+
+
+class Site:
+    """One Zola repository managed by the admin.
+
+    Everything that must not be shared between sites lives here: the paths,
+    the per-file locks and the push queue. Locks and pushes are also
+    coordinated with other worker processes. Repository handles are opened per
+    request and the push worker is only started on first use, so an idle site
+    costs little more than this object.
+    """
+
+    def __init__(self, slug: str, name: str, repo_path: str):
+        self.slug = slug
+        self.name = name
+        self.repo_path = repo_path
+        self.template_dir = os.path.join(repo_path, "templates")
+        self.blog_content_path = os.path.join(repo_path, "content", "blog")
+        self.path_locks = concurrency.PathLocks(repo_path)
+        self._push_queue: Optional[ThreadPoolExecutor] = None
+        self._push_queue_lock = threading.Lock()
+
+    def repo(self) -> Repo:
+        """Opens a handle on the site repository; handles are not shared between threads."""
+        return Repo(self.repo_path)
+
+    def push(self, timeout: Optional[float] = None):
+        """Pushes the current branch to origin from this site's own git worker.
+
+        Pushes of one site run one after another; a slow push only delays
+        later pushes of the same site.
+
+        Raises:
+            GitTimeout: If the push did not finish within `timeout` seconds,
+                including time spent waiting behind other pushes. The git
+                process is killed; commits are pushed with the next push.
+
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._push_queue_lock:
+            if self._push_queue is None:
+                self._push_queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"git-push-{self.slug}")
+                # Sites dropped from the registry cache stop their worker once nobody uses them anymore
+                weakref.finalize(self, self._push_queue.shutdown, wait=False)
+            future = self._push_queue.submit(self._push, deadline)
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise GitTimeout(f"Push of {self.slug} did not finish within {timeout:g}s")
+
+    def _push(self, deadline: Optional[float] = None):
+        with coordination.repo_lock(self.repo_path, "push"):
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return  # The caller gave up; a later push sends these commits
+            origin = self.repo().remote(name="origin")
+            origin.push(kill_after_timeout=remaining)
+
+    def close(self):
+        """Stops the push worker after queued pushes; a later push starts a new one."""
+        with self._push_queue_lock:
+            if self._push_queue is not None:
+                self._push_queue.shutdown(wait=False)
+                self._push_queue = None
+
+
+class SitePrefixMiddleware:
+    """Serves /site/<slug>/<path> as /<path> and records the slug in the ASGI scope."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and scope["path"].startswith("/site/"):
+            slug, _, rest = scope["path"][len("/site/"):].partition("/")
+            if slug:
+                scope = dict(scope, path="/" + rest, raw_path=("/" + rest).encode(), site_slug=slug)
+        await self.app(scope, receive, send)
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Creates the site registry table if it does not exist yet."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sites (
+            site_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            slug TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            repo_path TEXT NOT NULL
+        )
+    ''')
+
+
+class SiteRegistry:
+    """Sites registered in the database, plus the one configured by GIT_REPO_PATH.
+
+    Loaded sites are cached per worker process; `signals` tells the cache
+    when another worker added or removed a site.
+    """
+
+    def __init__(self, connect, default_repo_path: Optional[str] = None,
+                 signals: Optional[coordination.CacheSignals] = None):
+        self._connect = connect
+        self._default_repo_path = default_repo_path
+        self._signals = signals
+        self._lock = threading.Lock()
+        self._sites: Dict[str, Site] = {}
+
+    def _drop_stale_cache(self):
+        if self._signals is None or not self._signals.changed("sites"):
+            return
+        # Requests and scheduler ticks may still hold the dropped sites and
+        # push with them; each one stops its push worker once it is released.
+        with self._lock:
+            self._sites = {}
+
+    def _load(self, slug: str) -> Optional[Site]:
+        if slug == DEFAULT_SITE and self._default_repo_path:
+            return Site(DEFAULT_SITE, "Default", self._default_repo_path)
+        with self._connect() as conn:
+            ensure_schema(conn)
+            row = conn.execute('SELECT slug, name, repo_path FROM sites WHERE slug = ?', (slug,)).fetchone()
+        return Site(row[0], row[1], row[2]) if row else None
+
+    def get(self, slug: str) -> Optional[Site]:
+        """Returns the site with `slug`, or None if it is not registered."""
+        self._drop_stale_cache()
+        with self._lock:
+            site = self._sites.get(slug)
+            if site is None:
+                site = self._load(slug)
+                if site is not None:
+                    self._sites[slug] = site
+            return site
+
+    def default_slug(self) -> Optional[str]:
+        """Returns the slug used when a request does not name a site."""
+        if self._default_repo_path:
+            return DEFAULT_SITE
+        sites = self.list()
+        return sites[0]["slug"] if sites else None
+
+    def list(self) -> List[Dict[str, str]]:
+        """Returns all sites as dictionaries with slug, name and repo_path."""
+        sites = []
+        if self._default_repo_path:
+            sites.append({"slug": DEFAULT_SITE, "name": "Default", "repo_path": self._default_repo_path})
+        with self._connect() as conn:
+            ensure_schema(conn)
+            rows = conn.execute('SELECT slug, name, repo_path FROM sites ORDER BY name').fetchall()
+        sites.extend({"slug": r[0], "name": r[1], "repo_path": r[2]} for r in rows)
+        return sites
+
+    def add(self, slug: str, name: str, repo_path: str):
+        """Registers a site.
+
+        Raises:
+            ValueError: If the slug is reserved or the path is not a git repository.
+            sqlite3.IntegrityError: If the slug is already registered.
+
+        """
+        if slug == DEFAULT_SITE:
+            raise ValueError(f'"{DEFAULT_SITE}" is reserved for the site configured by GIT_REPO_PATH')
+        if not os.path.isdir(os.path.join(repo_path, ".git")):
+            raise ValueError(f"{repo_path} is not a git repository")
+        with self._connect() as conn:
+            ensure_schema(conn)
+            conn.execute('INSERT INTO sites (slug, name, repo_path) VALUES (?, ?, ?)', (slug, name, repo_path))
+            conn.commit()
+        if self._signals is not None:
+            self._signals.bump("sites")
+        logging.info(f"Registered site {slug} at {repo_path}")
+
+    def remove(self, slug: str):
+        """Unregisters a site; its repository is left untouched."""
+        with self._connect() as conn:
+            ensure_schema(conn)
+            conn.execute('DELETE FROM sites WHERE slug = ?', (slug,))
+            conn.commit()
+        if self._signals is not None:
+            self._signals.bump("sites")
+        with self._lock:
+            self._sites.pop(slug, None)
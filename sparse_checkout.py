@@ -0,0 +1,76 @@
+import logging
+import os
+from typing import Optional, Sequence
+
+from git import Repo
+
+# The only directories of the site the admin reads or writes.
+SPARSE_PATHS = ("content", "templates")
+
+
+def sparse_checkout_enabled() -> bool:
+    """Returns True if GIT_SPARSE_CHECKOUT asks for a sparse checkout of GIT_REPO_PATH."""
+    return os.getenv("GIT_SPARSE_CHECKOUT", "").lower() in ("1", "true", "yes")
+
+
+def sparse_paths(repo: Repo) -> Optional[list]:
+    """Returns the directories of a cone-mode sparse checkout, or None if the checkout is full."""
+    with repo.config_reader() as config:
+        if not config.get_value("core", "sparseCheckout", default=False):
+            return None
+    return [line for line in repo.git.sparse_checkout("list").splitlines() if line]
+
+
+def apply_sparse_checkout(repo: Repo, paths: Sequence[str] = SPARSE_PATHS):
+    """Limits the working tree of `repo` to `paths` (plus the files at the repository root).
+
+    Args:
+        repo (Repo): The site repository.
+        paths (Sequence[str]): Top-level directories to keep checked out.
+
+    """
+    repo.git.sparse_checkout("set", "--cone", *paths)
+    logging.info(f"Sparse checkout of {repo.working_tree_dir} limited to: {', '.join(paths)}")
+
+
+def ensure_sparse_checkout(repo: Repo, paths: Sequence[str] = SPARSE_PATHS) -> bool:
+    """Applies the sparse checkout if the repository is not already limited to `paths`.
+
+    Returns:
+        bool: True if the working tree was changed.
+
+    """
+    if sorted(sparse_paths(repo) or []) == sorted(paths):
+        return False
+    apply_sparse_checkout(repo, paths)
+    return True
+
+
+def clone_sparse(remote_url: str, path: str, branch: Optional[str] = None, partial: bool = True,
+                 paths: Sequence[str] = SPARSE_PATHS) -> Repo:
+    """Clones a site repository with only the directories the admin edits checked out.
+
+    With `partial`, the clone is blob-filtered: commits and trees are fetched
+    in full, but file contents are only downloaded for the checked-out paths
+    (and later on demand, e.g. when showing an old revision).
+
+    Args:
+        remote_url (str): The URL of the site repository.
+        path (str): Where to create the checkout.
+        branch (Optional[str]): The branch to check out, defaulting to the remote HEAD.
+        partial (bool): Whether to skip downloading blobs outside the checkout.
+        paths (Sequence[str]): Top-level directories to check out.
+
+    Returns:
+        Repo: The new repository.
+
+    """
+    options = ["--sparse", "--no-checkout"]
+    if partial:
+        options.append("--filter=blob:none")
+    if branch:
+        options += ["--branch", branch]
+    repo = Repo.clone_from(remote_url, path, multi_options=options)
+    apply_sparse_checkout(repo, paths)
+    repo.git.checkout(repo.active_branch.name)
+    return repo
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+POSTS = {
+    "content/blog/technology/python/hello.md": '+++\ntitle = "Hello"\ndate = "2024-01-01"\n+++\nHello world.\n',
+    "content/blog/technology/other.md": '+++\ntitle = "Other"\ndate = "2024-01-02"\n+++\nOther post.\n',
+    "templates/page.html": "<html></html>\n",
+}
+
+
+def git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture(scope="session")
+def site_repo(tmp_path_factory):
+    """A site repository with a few posts and a template, pushing to a local bare origin."""
+    base = tmp_path_factory.mktemp("site")
+    origin, repo = str(base / "origin.git"), str(base / "site")
+    git(base, "init", "-q", "--bare", "-b", "master", origin)
+    git(base, "init", "-q", "-b", "master", repo)
+    git(repo, "config", "user.email", "tests@zola-admin.local")
+    git(repo, "config", "user.name", "tests")
+    for path, content in POSTS.items():
+        os.makedirs(os.path.join(repo, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(repo, path), "w") as f:
+            f.write(content)
+    os.makedirs(os.path.join(repo, "static"))
+    git(repo, "add", "-A")
+    git(repo, "commit", "-qm", "init")
+    git(repo, "remote", "add", "origin", origin)
+    git(repo, "push", "-q", "-u", "origin", "master")
+    return repo
+
+
+@pytest.fixture(scope="session")
+def appmod(site_repo, tmp_path_factory):
+    """The admin app, serving `site_repo` with its own database and a user "tester"."""
+    os.environ.update(GIT_REPO_PATH=site_repo, SECRET_KEY="0" * 64, SCHEDULER_INTERVAL="0", FS_WATCHER="0")
+    os.chdir(ROOT)
+    import admin_db
+    admin_db.DB_PATH = str(tmp_path_factory.mktemp("db") / "admin.db")
+    with sqlite3.connect(admin_db.DB_PATH) as conn:
+        conn.execute("CREATE TABLE users (userid INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT)")
+    import app
+    with sqlite3.connect(admin_db.DB_PATH) as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", ("tester", app.hash_password("secret")))
+    return app
+
+
+@pytest.fixture
+def client(appmod):
+    """A test client logged in as "tester"."""
+    from fastapi.testclient import TestClient
+
+    client = TestClient(appmod.app)
+    response = client.post("/login/", data={"username": "tester", "password": "secret"}, follow_redirects=False)
+    assert response.status_code == 303
+    return client
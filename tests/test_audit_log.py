@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import audit_log
+
+
+class RecordingLog:
+    def __init__(self):
+        self.entries = []
+
+    def record(self, **entry):
+        self.entries.append(entry)
+
+
+def call(app, method="POST"):
+    scope = {"type": "http", "method": method, "path": "/x", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    log = RecordingLog()
+    asyncio.run(audit_log.AuditMiddleware(app, log)(scope, receive, send))
+    return log.entries
+
+
+def test_exception_of_unaudited_route_propagates():
+    async def app(scope, receive, send):
+        scope["state"]["audit"] = False
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        call(app)
+
+
+def test_unaudited_route_is_not_logged():
+    async def app(scope, receive, send):
+        scope["state"]["audit"] = False
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    assert call(app) == []
+
+
+def test_mutating_request_is_logged_with_status():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+
+    [entry] = call(app)
+    assert entry["action"] == "POST /x"
+    assert entry["status"] == 201
@@ -0,0 +1,17 @@
+import os
+import subprocess
+
+
+def test_delete_post_pulls_and_commits(client, site_repo):
+    path = os.path.join(site_repo, "content/blog/technology/doomed.md")
+    with open(path, "w") as f:
+        f.write('+++\ntitle = "Doomed"\n+++\nGone soon.\n')
+    subprocess.run(["git", "add", path], cwd=site_repo, check=True)
+    subprocess.run(["git", "commit", "-qm", "Add doomed"], cwd=site_repo, check=True)
+    subprocess.run(["git", "push", "-q"], cwd=site_repo, check=True)
+
+    response = client.post("/delete-post/technology/doomed.md", follow_redirects=False)
+    assert response.status_code == 303, response.text
+    assert not os.path.exists(path)
+    log = subprocess.run(["git", "log", "-1", "--format=%s"], cwd=site_repo, capture_output=True, text=True)
+    assert log.stdout.strip() == "Delete file: technology/doomed.md"
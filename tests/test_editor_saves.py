@@ -0,0 +1,40 @@
+import os
+import re
+
+
+def base_blob(page: str) -> str:
+    return re.search(r'name="base_blob" value="([0-9a-f]{40})"', page).group(1)
+
+
+def test_post_saved_twice_with_crlf(client, site_repo):
+    url = "/markdown/edit/technology/python/hello.md"
+    for body in ("line1\r\nline2\r\n", "line1\r\nline2\r\nline3\r\n"):
+        form = {
+            "title": "Hello", "description": "A post", "date": "2024-01-01", "draft": "false", "og_image": "hello.png",
+            "keywords": "python", "content": body, "base_blob": base_blob(client.get(url).text),
+        }
+        response = client.post(url, data=form, follow_redirects=False)
+        assert response.status_code == 303, response.text
+    with open(f"{site_repo}/content/blog/technology/python/hello.md", "rb") as f:
+        assert f.read().endswith(b"line1\r\nline2\r\nline3\r\n")
+
+
+def test_template_saved_twice_with_crlf(client, site_repo):
+    url = "/templates/edit/page"
+    for body in ("<html>\r\n</html>\r\n", "<html>\r\n<body></body>\r\n</html>\r\n"):
+        form = {"content": body, "base_blob": base_blob(client.get(url).text)}
+        response = client.post(url, data=form, follow_redirects=False)
+        assert response.status_code == 303, response.text
+
+
+def test_anonymous_new_post_is_not_written(appmod, site_repo):
+    from fastapi.testclient import TestClient
+
+    form = {
+        "template_name": "Anon Post", "category": "technology", "description": "x", "keywords": "x",
+        "date": "2024-01-01", "author": "anon", "content": "Anonymous.",
+    }
+    response = TestClient(appmod.app).post("/add-new-post/", data=form, follow_redirects=False)
+    assert response.status_code == 303
+    assert response.headers["location"] == "/login/"
+    assert not os.path.exists(os.path.join(site_repo, "content/blog/technology/anon-post.md"))
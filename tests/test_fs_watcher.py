@@ -0,0 +1,52 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+import fs_watcher
+
+pytestmark = pytest.mark.skipif(not fs_watcher.watcher_enabled(), reason="inotify is not available")
+
+
+@pytest.fixture
+def watched(tmp_path, monkeypatch):
+    """A watched site with one post in a subdirectory, and a function waiting for the next batch."""
+    monkeypatch.setattr(fs_watcher, "QUIET_SECONDS", 0.05)
+    os.makedirs(tmp_path / "site/content/blog/tech")
+    os.makedirs(tmp_path / "site/templates")
+    (tmp_path / "site/content/blog/tech/post.md").write_text("+++\n+++\n")
+    watcher = fs_watcher.Watcher()
+    batches, arrived = [], threading.Event()
+    watcher.subscribe(lambda batch: (batches.append(batch), arrived.set()))
+    watcher.add_site("t", str(tmp_path / "site"))
+    watcher.start()
+
+    def next_paths():
+        assert arrived.wait(5)
+        arrived.clear()
+        return batches.pop().paths
+
+    yield tmp_path, watcher, next_paths
+    watcher.stop()
+
+
+def test_directory_moved_out_reports_its_files(watched):
+    tmp_path, watcher, next_paths = watched
+    shutil.move(str(tmp_path / "site/content/blog/tech"), str(tmp_path / "elsewhere"))
+    assert next_paths() == {"content/blog/tech", "content/blog/tech/post.md"}
+
+    # The moved directory is no longer watched
+    (tmp_path / "elsewhere/other.md").write_text("x")
+    (tmp_path / "site/content/blog/new.md").write_text("x")
+    assert next_paths() == {"content/blog/new.md"}
+
+
+def test_directory_renamed_inside_tree_reports_old_and_new_files(watched):
+    tmp_path, watcher, next_paths = watched
+    os.rename(tmp_path / "site/content/blog/tech", tmp_path / "site/content/blog/python")
+    assert next_paths() == {"content/blog/tech", "content/blog/tech/post.md",
+                            "content/blog/python", "content/blog/python/post.md"}
+
+    (tmp_path / "site/content/blog/python/post.md").write_text("y")
+    assert next_paths() == {"content/blog/python/post.md"}
@@ -0,0 +1,3 @@
+def test_template_editor_watches_template_file(client):
+    page = client.get("/templates/edit/page").text
+    assert 'const watchPath = "templates/page.html";' in page